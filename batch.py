@@ -0,0 +1,180 @@
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from PIL import Image
+
+import drawing as dg
+from cache import GradientCache, default_directory
+from pipeline import Pipeline
+from scratch import Scratch, sweep
+from streaming import stream, streamable
+
+def collect(inputs: list, recursive: bool) -> list:
+    # pairs of a file and its name under the output directory, files found in a directory keep
+    # their path relative to it so equally named files of different subdirectories don't meet
+    extensions = {extension for extension, format in Image.registered_extensions().items() if format in Image.OPEN}
+    paths = {}
+
+    for input in inputs:
+        if os.path.isdir(input):
+            pattern = os.path.join(input, "**", "*") if recursive else os.path.join(input, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        elif glob.has_magic(input):
+            candidates = glob.glob(input, recursive=True)
+        else:
+            candidates = [input]
+
+        for path in sorted(path for path in candidates
+                           if os.path.isfile(path) and os.path.splitext(path)[1].lower() in extensions):
+            # keep the first occurrence of every file
+            name = os.path.relpath(path, input) if os.path.isdir(input) else os.path.basename(path)
+            paths.setdefault(path, os.path.splitext(name)[0])
+
+    return list(paths.items())
+
+_cache = None
+_scratch = None
+
+def convert(path: str, output: str, settings: dict, cache: tuple = None, memory: int = None,
+            encoding: dict = None, scratch: str = None) -> float:
+    global _cache, _scratch
+    start = time.perf_counter()
+
+    # strips keep huge scans within the memory budget, they don't go through the cache, files
+    # that would have to be decoded whole to be streamed are drawn like any other
+    if memory is not None and streamable(path):
+        stream(path, output, memory, encoding=encoding, **settings)
+        return time.perf_counter() - start
+
+    # every worker process keeps one cache so its in memory entries survive between images
+    if cache is not None and _cache is None:
+        _cache = GradientCache(cache[0], disk_limit=cache[1])
+
+    if scratch is not None and _scratch is None:
+        _scratch = Scratch(scratch)
+
+    drawing = Pipeline(path, _cache, scratch=_scratch).evaluate(settings, "drawing")["drawing"]
+
+    dg.export(drawing, output, **(encoding or {}))
+
+    # worker processes end without waiting for the cache writer, its entry is written by now
+    if _cache is not None:
+        _cache.flush()
+
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts images to line art without the GUI")
+    parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="directory the drawings are written to")
+    parser.add_argument("--scale", type=float, default=1.5, help="resize factor applied before drawing")
+    parser.add_argument("--rasterization", type=float, default=2.0, help="rasterization factor of the lines")
+    parser.add_argument("--shadow", type=int, default=72, help="shadow threshold")
+    parser.add_argument("--edge", type=int, default=164, help="edge threshold")
+    parser.add_argument("--operator", default="prewitt", choices=sorted(dg.operators), help="edge operator")
+    parser.add_argument("--engine", default="upscale", choices=["upscale", "native"],
+                        help="rasterize engine, native applies to whole rasterization factors only")
+    parser.add_argument("--format", default="png", choices=["png", "webp", "tiff", "group4"],
+                        help="file format of the drawings, group4 writes 1-bit TIFF")
+    parser.add_argument("--compression", type=int, default=6, choices=range(10), metavar="0-9",
+                        help="compression level, higher is smaller and slower")
+    parser.add_argument("--transparent", action="store_true", help="black ink on a transparent background")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--recursive", action="store_true", help="descend into subdirectories")
+    parser.add_argument("--overwrite", action="store_true", help="redo drawings that already exist")
+    parser.add_argument("--cache", nargs="?", const=default_directory(), default=None, metavar="DIRECTORY",
+                        help="reuse gradient maps of images seen before, stored in DIRECTORY")
+    parser.add_argument("--cache-size", type=int, default=2048, help="size limit of the cache directory in MB")
+    parser.add_argument("--stream", nargs="?", type=int, const=512, default=None, metavar="MB",
+                        help="draw images stored in strips or tiles, like most TIFF scans, a strip at a time within "
+                             "this memory budget per worker, other files are drawn whole")
+    parser.add_argument("--scratch", nargs="?", const=tempfile.gettempdir(), default=None, metavar="DIRECTORY",
+                        help="keep the intermediate planes of large images in files under DIRECTORY")
+    args = parser.parse_args()
+
+    if args.stream is not None and args.operator in dg.global_operators:
+        parser.error(f"--operator {args.operator} looks at the whole image and can't be used with --stream")
+
+    if args.stream is not None and (args.transparent or args.format == "group4"):
+        parser.error("--transparent and --format group4 convert the whole drawing at once and can't be used "
+                     "with --stream")
+
+    settings = {
+        "scale": args.scale,
+        "edge": args.rasterization,
+        "shadow_threshold": args.shadow,
+        "edge_threshold": args.edge,
+        "operator": args.operator,
+        "engine": args.engine,
+    }
+
+    encoding = {"format": args.format, "level": args.compression, "transparent": args.transparent}
+
+    os.makedirs(args.output, exist_ok=True)
+
+    extension = {"png": ".png", "webp": ".webp"}.get(args.format, ".tif")
+    sources = {}
+    for path, name in collect(args.inputs, args.recursive):
+        sources.setdefault(os.path.join(args.output, name + extension), []).append(path)
+
+    # files differing only in their extension, or given from different directories, would
+    # overwrite each other's drawing, none of them is converted
+    failed = 0
+    jobs = []
+    for output, paths in sources.items():
+        if len(paths) > 1:
+            failed += len(paths)
+            print(f"{', '.join(paths)}: would all be written to {output}", file=sys.stderr)
+        elif args.overwrite or not os.path.exists(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            jobs.append((paths[0], output))
+
+    if not jobs:
+        print("Nothing to convert")
+        return 1 if failed else 0
+
+    done = 0
+
+    # only a couple of images per worker are in flight, which bounds the memory of a long run
+    with ProcessPoolExecutor(max(args.workers, 1)) as pool:
+        pending = {}
+        queue = iter(jobs)
+
+        while True:
+            while len(pending) < 2 * max(args.workers, 1):
+                job = next(queue, None)
+                if job is None:
+                    break
+                cache = None if args.cache is None else (args.cache, args.cache_size * 1024 * 1024)
+                memory = None if args.stream is None else args.stream * 1024 * 1024
+                pending[pool.submit(convert, job[0], job[1], settings, cache, memory, encoding, args.scratch)] = job
+
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, output = pending.pop(future)
+                done += 1
+
+                try:
+                    elapsed = future.result()
+                except Exception as error:
+                    failed += 1
+                    print(f"[{done}/{len(jobs)}] {path}: {error}", file=sys.stderr)
+                else:
+                    print(f"[{done}/{len(jobs)}] {path} -> {output} ({elapsed:.1f} s)")
+
+    # the scratch files workers couldn't unlink while they were mapped
+    if args.scratch is not None:
+        sweep(args.scratch)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
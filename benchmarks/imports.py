@@ -0,0 +1,51 @@
+import argparse
+import os
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# each measurement runs in a fresh interpreter so nothing is cached in sys.modules
+probe = """
+import sys, time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start, "PySide6" in sys.modules)
+"""
+
+def measure(statement: str, repeat: int) -> tuple:
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", probe.format(statement=statement)],
+                                cwd=root, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(output[0]))
+        qt = output[1] == "True"
+
+    return min(times), qt
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures how long importing the drawing pipeline takes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ratio", type=float, default=0.75,
+                        help="largest accepted share of the import time with the Qt adapters loaded")
+    args = parser.parse_args()
+
+    pipeline, qt = measure("import drawing", args.repeat)
+    print(f"import drawing               {pipeline * 1000:8.1f} ms  Qt loaded: {qt}")
+
+    try:
+        adapters, _ = measure("import drawing\nfrom PySide6.QtGui import QPixmap, QImage", args.repeat)
+    except subprocess.CalledProcessError:
+        print("PySide6 is not installed, skipping the comparison")
+        return 1 if qt else 0
+
+    print(f"import drawing + Qt adapters {adapters * 1000:8.1f} ms  ratio: {pipeline / adapters:.2f}")
+
+    if qt or pipeline / adapters > args.ratio:
+        print("the pipeline import pulls in more than it should", file=sys.stderr)
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import drawing as dg
+
+def synthetic_mask(width: int, height: int, seed: int = 0) -> Image.Image:
+    # strokes of varying width over sensor noise, thresholded through the edge stage
+    rng = np.random.default_rng(seed)
+    image = Image.new("L", (width, height), 200)
+    canvas = ImageDraw.Draw(image)
+
+    for _ in range(width * height // 8000):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        radius = rng.integers(5, max(width, height) // 10)
+        canvas.ellipse((x - radius, y - radius, x + radius, y + radius),
+                       outline=int(rng.integers(0, 120)), width=int(rng.integers(1, 4)))
+        canvas.line((x, y, rng.integers(0, width), rng.integers(0, height)),
+                    fill=int(rng.integers(0, 160)), width=int(rng.integers(1, 3)))
+
+    noisy = np.asarray(image, dtype=np.float32) + rng.normal(0, 20, (height, width))
+    image = Image.fromarray(noisy.clip(0, 255).astype(np.uint8))
+
+    return dg.thresholding(dg.gradient(image, "prewitt", 1.5), 164)
+
+def measure(function, repeat: int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return result, best
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the upscale and native rasterize engines")
+    parser.add_argument("--size", default="2000x1500", help="mask size as WIDTHxHEIGHT")
+    parser.add_argument("--edges", default="1,1.5,2,2.5,3,4,5", help="comma separated rasterization factors")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    mask = synthetic_mask(width, height)
+
+    print(f"{width}x{height} mask, best of {args.repeat}")
+    print(f"{'edge':>5} {'upscale ms':>11} {'native ms':>10} {'speedup':>8} {'mean err':>9} {'max err':>8} {'psnr db':>8}")
+
+    for edge in (float(value) for value in args.edges.split(",")):
+        reference, upscale_time = measure(lambda: dg.rasterize(mask, edge, "upscale"), args.repeat)
+        result, native_time = measure(lambda: dg.rasterize(mask, edge, "native"), args.repeat)
+
+        difference = np.asarray(reference, dtype=np.float32) - np.asarray(result, dtype=np.float32)
+        mse = float(np.mean(difference ** 2))
+        psnr = float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+        print(f"{edge:>5} {upscale_time * 1000:>11.1f} {native_time * 1000:>10.1f} {upscale_time / native_time:>7.1f}x "
+              f"{np.abs(difference).mean():>9.3f} {np.abs(difference).max():>8.0f} {psnr:>8.1f}")
+
+if __name__ == "__main__":
+    main()
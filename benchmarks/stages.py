@@ -0,0 +1,224 @@
+import argparse
+import ctypes
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import PIL
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import drawing as dg
+
+def synthetic_photo(megapixels: float, seed: int = 0) -> Image.Image:
+    # a 4:3 RGBA image with soft gradients, strokes, sensor noise and a partly transparent alpha
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(seed)
+
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.empty((height, width, 3), dtype=np.uint8)
+    base[..., 0] = (x * 0.6 + y * 0.3).astype(np.uint8)
+    base[..., 1] = (255 - x * 0.5).astype(np.uint8) - (y * 0.2).astype(np.uint8)
+    base[..., 2] = (y * 0.8).astype(np.uint8)
+
+    image = Image.fromarray(base)
+    canvas = ImageDraw.Draw(image)
+    scale = max(width, height)
+
+    for _ in range(400):
+        cx, cy = int(rng.integers(0, width)), int(rng.integers(0, height))
+        radius = int(rng.integers(scale // 200 + 1, scale // 8 + 2))
+        color = tuple(int(value) for value in rng.integers(0, 256, 3))
+        canvas.ellipse((cx - radius, cy - radius, cx + radius, cy + radius), outline=color,
+                       width=int(rng.integers(1, max(scale // 500, 2) + 1)))
+        canvas.line((cx, cy, int(rng.integers(0, width)), int(rng.integers(0, height))), fill=color,
+                    width=int(rng.integers(1, max(scale // 1000, 1) + 2)))
+
+    pixels = np.asarray(image).copy()
+    noise = rng.integers(0, 24, (height, width), dtype=np.uint8)
+    np.subtract(pixels, noise[..., None], out=pixels, where=pixels >= noise[..., None])
+
+    alpha = np.broadcast_to(np.linspace(96, 255, width, dtype=np.float32).astype(np.uint8), (height, width))
+    return Image.fromarray(np.dstack((pixels, alpha)))
+
+def sample_photo(path: str, megapixels: float) -> Image.Image:
+    with Image.open(path) as image:
+        factor = (megapixels * 1e6 / (image.size[0] * image.size[1])) ** 0.5
+        size = (max(int(image.size[0] * factor), 1), max(int(image.size[1] * factor), 1))
+        return image.convert("RGBA").resize(size, resample=Image.BICUBIC)
+
+def stages(photo: Image.Image) -> dict:
+    # every stage gets inputs of the measured size, prepared by the stages before it
+    opaque = dg.alpha_removal(photo)
+    grayscale = opaque.convert("L")
+    edge = dg.prewitt(grayscale, 1.5)
+    mask = dg.thresholding(edge, 164)
+    shadow = dg.rasterize(dg.thresholding(grayscale, 72))
+    lines = dg.rasterize(mask)
+    composite = dg.addition(shadow, lines)
+
+    return {
+        "alpha_removal": lambda: dg.alpha_removal(photo),
+        "resize": lambda: dg.resize(opaque, 1.5),
+        "prewitt": lambda: dg.prewitt(grayscale, 1.5),
+        "thresholding": lambda: dg.thresholding(edge, 164),
+        "rasterize": lambda: dg.rasterize(mask, 2),
+        "addition": lambda: dg.addition(shadow, lines),
+        "pil_to_pixmap": lambda: dg.pil_to_pixmap(composite),
+        "lineart": lambda: dg.lineart(opaque, 1.5, 164, "prewitt"),
+    }
+
+def fixed_heap():
+    # glibc raises its mmap threshold after large frees and then serves big buffers from a heap
+    # that never shrinks, a fixed threshold lets every large buffer show up in the resident set
+    try:
+        libc = ctypes.CDLL("libc.so.6")
+        libc.mallopt(-3, 128 * 1024)
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+libc = fixed_heap()
+
+def resident() -> tuple:
+    # current and peak resident set in bytes, None where /proc isn't available
+    try:
+        with open("/proc/self/status") as status:
+            fields = dict(line.split(":", 1) for line in status)
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        return None
+
+def reset_peak() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as refs:
+            refs.write("5")
+        return resident() is not None
+    except OSError:
+        return False
+
+def measure(function, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # the peak is taken on a separate run so tracing doesn't skew the timings, the resident
+    # high water mark also counts what PIL allocates, tracemalloc only sees Python and NumPy
+    if libc is not None:
+        libc.malloc_trim(0)
+
+    if reset_peak():
+        before = resident()[0]
+        function()
+        peak = resident()[1] - before
+    else:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {"seconds": best, "peak_bytes": max(peak, 0)}
+
+def compare(results: list, baseline: dict, tolerance: float) -> int:
+    previous = {(entry["input"], entry["megapixels"], entry["stage"]): entry for entry in baseline["results"]}
+    regressions = 0
+
+    print(f"\n{'input':<16} {'MP':>5} {'stage':<14} {'baseline ms':>12} {'ms':>10} {'ratio':>7} {'peak MB':>9} {'was MB':>8}")
+    for entry in results:
+        old = previous.get((entry["input"], entry["megapixels"], entry["stage"]))
+        if old is None:
+            continue
+
+        ratio = entry["seconds"] / old["seconds"]
+        flag = ""
+        if ratio > tolerance or entry["peak_bytes"] > old["peak_bytes"] * tolerance + 16 * 1024 * 1024:
+            regressions += 1
+            flag = "  regression"
+
+        print(f"{entry['input']:<16} {entry['megapixels']:>5g} {entry['stage']:<14} {old['seconds'] * 1000:>12.1f} "
+              f"{entry['seconds'] * 1000:>10.1f} {ratio:>6.2f}x {entry['peak_bytes'] / 2 ** 20:>9.1f} "
+              f"{old['peak_bytes'] / 2 ** 20:>8.1f}{flag}")
+
+    print(f"\n{regressions} regression(s) beyond {tolerance:.2f}x")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the drawing stages across image sizes")
+    parser.add_argument("--sizes", default="1,4,12,48", help="comma separated input sizes in megapixels")
+    parser.add_argument("--stages", default=None, help="comma separated stages to run, all by default")
+    parser.add_argument("--samples", nargs="*", default=[], help="sample images measured next to the synthetic one")
+    parser.add_argument("--repeat", type=int, default=3, help="timings are the best of this many runs")
+    parser.add_argument("--output", default=None, help="JSON file the results are written to")
+    parser.add_argument("--baseline", default=None, help="JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    # pixmaps need a GUI application, which doesn't need a screen
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PySide6.QtGui import QGuiApplication
+        application = QGuiApplication.instance() or QGuiApplication([])
+    except ImportError:
+        application = None
+
+    selected = None if args.stages is None else set(args.stages.split(","))
+    inputs = [("synthetic", None)] + [(os.path.basename(path), path) for path in args.samples]
+    results = []
+
+    print(f"{'input':<16} {'MP':>5} {'stage':<14} {'ms':>10} {'MP/s':>8} {'peak MB':>9}")
+    for megapixels in (float(value) for value in args.sizes.split(",")):
+        for name, path in inputs:
+            photo = synthetic_photo(megapixels) if path is None else sample_photo(path, megapixels)
+            pixels = photo.size[0] * photo.size[1] / 1e6
+
+            for stage, function in stages(photo).items():
+                if selected is not None and stage not in selected:
+                    continue
+
+                if stage == "pil_to_pixmap" and application is None:
+                    print(f"{name:<16} {megapixels:>5g} {stage:<14} skipped, PySide6 is not installed")
+                    continue
+
+                measured = measure(function, args.repeat)
+                entry = {"input": name, "megapixels": megapixels, "size": list(photo.size), "stage": stage,
+                         "megapixels_per_second": pixels / measured["seconds"], **measured}
+                results.append(entry)
+
+                print(f"{name:<16} {megapixels:>5g} {stage:<14} {entry['seconds'] * 1000:>10.1f} "
+                      f"{entry['megapixels_per_second']:>8.1f} {entry['peak_bytes'] / 2 ** 20:>9.1f}")
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nwrote {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            return 1 if compare(results, json.load(file), args.tolerance) else 0
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+from PIL import Image
+
+# bump when the gradient stage changes so stale entries are never read back
+VERSION = 1
+
+def default_directory() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "dijkstra")
+
+class GradientCache:
+    # content addressed store for the resized grayscale plane and its gradient map,
+    # kept in a size bounded in memory LRU in front of a size bounded directory
+    def __init__(self, directory: str = None, memory_limit: int = None, disk_limit: int = None):
+        if memory_limit is None:
+            memory_limit = 256 * 1024 * 1024
+
+        if disk_limit is None:
+            disk_limit = 2 * 1024 * 1024 * 1024
+
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+
+        self.entries = OrderedDict()
+        self.memory = 0
+        self.usage = None
+        self.lock = threading.Lock()
+
+        # entries are written to the directory in the background, a miss costs the render nothing
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.writes = []
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def digest(image: Image.Image) -> str:
+        content = hashlib.blake2b(digest_size=20)
+        content.update(f"{image.mode} {image.size}".encode())
+        content.update(image.tobytes())
+
+        return content.hexdigest()
+
+    @staticmethod
+    def key(digest: str, scale: float, operator: str, power: float) -> str:
+        parameters = f"{VERSION} {digest} {float(scale)!r} {operator} {float(power)!r}"
+        return hashlib.blake2b(parameters.encode(), digest_size=20).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def get(self, key: str):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        if self.directory is None:
+            return None
+
+        path = self.path(key)
+        try:
+            with np.load(path) as stored:
+                entry = (stored["grayscale"], stored["gradient"])
+            # the modification time doubles as the last access for eviction
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+
+        self.remember(key, entry)
+        return entry
+
+    def put(self, key: str, grayscale: np.ndarray, gradient: np.ndarray):
+        entry = (np.asarray(grayscale), np.asarray(gradient))
+        self.remember(key, entry)
+
+        if self.directory is None:
+            return
+
+        with self.lock:
+            self.writes = [write for write in self.writes if not write.done()]
+            self.writes.append(self.writer.submit(self.write, key, entry))
+
+    def flush(self):
+        # waits for the entries still being written, before a process that can't wait at exit ends
+        with self.lock:
+            writes, self.writes = self.writes, []
+
+        wait(writes)
+
+    def write(self, key: str, entry: tuple):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written under a temporary name so concurrent readers never see half a file, and not
+        # compressed, compressing a pair took longer than computing the gradient again
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                np.savez(file, grayscale=entry[0], gradient=entry[1])
+            os.replace(temporary, path)
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return
+
+        # the directory is only scanned again once the running estimate is over the limit
+        if self.usage is None:
+            self.evict()
+        else:
+            self.usage += os.path.getsize(path)
+            if self.usage > self.disk_limit:
+                self.evict()
+
+    def remember(self, key: str, entry: tuple):
+        size = sum(plane.nbytes for plane in entry)
+        if size > self.memory_limit:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.memory -= sum(plane.nbytes for plane in self.entries.pop(key))
+
+            self.entries[key] = entry
+            self.memory += size
+
+            while self.memory > self.memory_limit:
+                _, evicted = self.entries.popitem(last=False)
+                self.memory -= sum(plane.nbytes for plane in evicted)
+
+    def evict(self):
+        files = []
+        for folder, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".npz"):
+                    path = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_limit:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+        self.usage = total
@@ -0,0 +1,118 @@
+import io
+from functools import lru_cache
+
+from PIL import Image, ImageOps
+
+try:
+    from PIL import ImageCms
+except ImportError:
+    ImageCms = None
+
+# the transposition undoing each value of the EXIF orientation tag, 5 to 8 swap width and height
+_orientation = 0x0112
+_transposes = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# modes reduce averages band by band, palette indices and 16 bit modes are left to the resize
+_reducible = {"L", "LA", "RGB", "RGBA", "RGBX", "CMYK", "I", "F"}
+
+def _open(source) -> Image.Image:
+    return Image.open(source) if isinstance(source, str) else source
+
+def orientation(image: Image.Image) -> int:
+    try:
+        return int(image.getexif().get(_orientation, 1))
+    except (TypeError, ValueError, SyntaxError, OSError):
+        return 1
+
+def stored_size(image: Image.Image) -> tuple:
+    # the size of the pixels as the file stores them, some Pillow versions report the upright
+    # size of TIFF files and turn them upright themselves while loading
+    tiles = getattr(image, "tile", None)
+    if not tiles:
+        return image.size
+
+    return max(tile[1][2] for tile in tiles), max(tile[1][3] for tile in tiles)
+
+def size(source) -> tuple:
+    # the upright size of the image, read from the header without decoding
+    image = _open(source)
+    try:
+        width, height = stored_size(image)
+        return (height, width) if orientation(image) in (5, 6, 7, 8) else (width, height)
+    finally:
+        if image is not source:
+            image.close()
+
+def reduction(scale: float) -> int:
+    # the largest whole factor the image can shrink by before decoding and still cover its drawing
+    return max(int(1 / scale), 1) if scale > 0 else 1
+
+def decode(source, reduction: int = None) -> Image.Image:
+    # decodes the image at path, or an opened image, at a size of at least 1 / reduction of the
+    # original, JPEG files skip the discarded resolution in the DCT, EXIF orientation is applied and
+    # an embedded ICC profile is converted to sRGB, all on the reduced pixels
+    if reduction is None:
+        reduction = 1
+
+    image = _open(source)
+    rotation = orientation(image)
+    profile = image.info.get("icc_profile")
+
+    width, height = image.size
+    target = (-(-width // reduction), -(-height // reduction))
+
+    # draft picks the smallest DCT scale still covering the target, only on files opened here
+    # as an image handed in may be decoded again with another reduction
+    if reduction > 1 and image is not source:
+        image.draft(image.mode, target)
+
+    image.load()
+
+    # loaders that turn the image upright themselves, like TIFF in recent Pillow, drop the tag
+    if orientation(image) != rotation:
+        rotation = 1
+
+    factor = min(image.size[0] // target[0], image.size[1] // target[1])
+    if factor > 1 and image.mode in _reducible:
+        image = image.reduce(factor)
+
+    # the tag goes with the transposition, the upright pixels would be turned again when decoded
+    if rotation in _transposes:
+        image = ImageOps.exif_transpose(image)
+
+    if profile:
+        image = to_srgb(image, profile)
+
+    return image
+
+@lru_cache(maxsize=16)
+def _transform(profile: bytes, mode: str, output: str):
+    # None when the pixels are sRGB already, which most cameras embed
+    source = ImageCms.ImageCmsProfile(io.BytesIO(profile))
+    if mode == output and (source.profile.profile_description or "").startswith("sRGB"):
+        return None
+
+    return ImageCms.buildTransform(source, ImageCms.createProfile("sRGB"), mode, output)
+
+def to_srgb(image: Image.Image, profile: bytes) -> Image.Image:
+    if ImageCms is None:
+        return image
+
+    output = "RGBA" if "A" in image.getbands() else "RGB"
+    try:
+        transform = _transform(profile, image.mode, output)
+        if transform is None:
+            return image
+
+        return ImageCms.applyTransform(image, transform)
+    except (ImageCms.PyCMSError, OSError, ValueError):
+        # a broken or unsupported profile leaves the pixels as they are
+        return image
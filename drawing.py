@@ -1,7 +1,34 @@
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
 import numpy as np
 from PIL import Image, ImageOps, ImageChops, ImageFilter
-from PySide6.QtGui import QPixmap, QImage
 
+from profiling import profiled
+
+# Qt is only needed to display results, the processing functions load NumPy and PIL only
+if TYPE_CHECKING:
+    from PySide6.QtGui import QPixmap
+
+# single channel stages pass uint8 arrays along, with float32 only inside the edge operators,
+# images are accepted everywhere and get an image back so they only convert at the edges
+def _plane(input) -> np.ndarray:
+    if isinstance(input, np.ndarray):
+        return input if input.ndim == 2 else np.asarray(Image.fromarray(input).convert("L"))
+
+    return np.asarray(input if input.mode == "L" else input.convert("L"))
+
+def _image(input) -> Image.Image:
+    return Image.fromarray(input) if isinstance(input, np.ndarray) else input
+
+def _as_kind(input, output):
+    if isinstance(input, np.ndarray):
+        return output if isinstance(output, np.ndarray) else np.asarray(output)
+
+    return output if isinstance(output, Image.Image) else Image.fromarray(output)
+
+@profiled
 def addition(a: Image.Image, b:Image.Image) -> Image.Image:
     a_i = ImageOps.invert(a)
     b_i = ImageOps.invert(b)
@@ -11,141 +38,666 @@ def addition(a: Image.Image, b:Image.Image) -> Image.Image:
 
     return result 
 
-def rasterize(input: Image.Image, edge: float = None) -> Image.Image:
+@profiled
+def rasterize(input: Image.Image, edge: float = None, engine: str = None) -> Image.Image:
     if edge is None:
         edge = 2
+
+    if engine is None:
+        engine = "upscale"
+
+    # the native filters reproduce whole factors only, others take the upscale path
+    if engine == "native" and edge > 1 and float(edge).is_integer():
+        return _rasterize_native(input, int(edge))
+
+    if engine not in ("upscale", "native"):
+        raise ValueError(f"Unknown rasterize engine '{engine}', expected upscale or native")
         
-    width, height = input.size
-    input = input.resize((int(width * edge), int(height * edge)), resample=Image.NEAREST)
-    input = input.filter(ImageFilter.MedianFilter())
-    input = input.resize((width, height), resample=Image.ADAPTIVE)
+    image = _image(input)
+    width, height = image.size
+    image = image.resize((int(width * edge), int(height * edge)), resample=Image.NEAREST)
+    image = image.filter(ImageFilter.MedianFilter())
+    image = image.resize((width, height), resample=Image.ADAPTIVE)
+
+    return _as_kind(input, image)
+
+@lru_cache(maxsize=32)
+def _rasterize_kernels(edge: int, radius: int = 3) -> tuple:
+    # 1d responses of the lanczos downscale by edge, measured on impulses covering a
+    # whole upscaled block and only its first or last pixel
+    size = 32
+    center = size // 2
+
+    kernels = []
+    for part in (slice(0, edge), slice(0, 1), slice(edge - 1, edge)):
+        impulse = np.zeros(size * edge, dtype=np.float32)
+        impulse[center * edge:(center + 1) * edge][part] = 1
+
+        response = Image.fromarray(impulse[None]).resize((size, 1), resample=Image.LANCZOS)
+        kernels.append(np.asarray(response)[0, center - radius:center + radius + 1][::-1].copy())
+
+    return tuple(kernels)
+
+def _correlate(image: np.ndarray, kernel: np.ndarray, axis: int) -> np.ndarray:
+    size = image.shape[axis] - len(kernel) + 1
+    taps = [image[tap:tap + size] if axis == 0 else image[:, tap:tap + size] for tap in range(len(kernel))]
+
+    result = taps[0] * kernel[0]
+    for tap, weight in zip(taps[1:], kernel[1:]):
+        result += tap * weight
+
+    return result
+
+def _rasterize_native(input: Image.Image, edge: int) -> Image.Image:
+    # the median of a nearest upscaled image only changes the corner pixels of a block,
+    # and only when the three neighbours towards a corner all lie on the same side of
+    # it, so upscale, median and downscale collapse into filters at native resolution
+    if edge == 1:
+        return _as_kind(input, _image(input).filter(ImageFilter.MedianFilter()))
+
+    whole, first, last = _rasterize_kernels(edge)
+    middle = whole - first - last
+    radius = len(whole) // 2
+
+    image = _plane(input).astype(np.float32)
+    height, width = image.shape
+    padded = np.pad(image, radius + 1, mode="edge")
+    output = np.empty((height, width), dtype=np.uint8)
+
+    for top in range(0, height, 64):
+        rows = padded[top:top + min(64, height - top) + 2 * radius + 2]
+        center = rows[1:-1, 1:-1]
+        size = center.shape
+        blocks = _correlate(center, whole, 1)
+
+        # horizontal pass, done separately for the first, middle and last upscaled row
+        # of every block and rounded to 8 bits in between like the two pass resample
+        passes = []
+        for vertical_offset in (0, 2):
+            vertical_neighbour = rows[vertical_offset:vertical_offset + size[0], 1:-1]
+            horizontal_pass = blocks.copy()
+
+            for horizontal_offset, horizontal in ((0, first), (2, last)):
+                horizontal_neighbour = rows[1:-1, horizontal_offset:horizontal_offset + size[1]]
+                diagonal = rows[vertical_offset:vertical_offset + size[0], horizontal_offset:horizontal_offset + size[1]]
+
+                low = np.minimum(np.minimum(vertical_neighbour, horizontal_neighbour), diagonal)
+                high = np.maximum(np.maximum(vertical_neighbour, horizontal_neighbour), diagonal)
+                corner = np.where(low > center, low, np.where(high < center, high, center))
+
+                horizontal_pass += _correlate(corner - center, horizontal, 1)
+
+            passes.append(horizontal_pass)
+
+        kernels = [first, last]
+
+        # with a factor of 2 every upscaled row is the first or the last of its block
+        if edge > 2:
+            passes.append(blocks)
+            kernels.append(middle)
+
+        result = None
+        for horizontal_pass, vertical in zip(passes, kernels):
+            np.floor(horizontal_pass + 0.5, out=horizontal_pass)
+            np.clip(horizontal_pass, 0, 255, out=horizontal_pass)
+
+            vertical_pass = _correlate(horizontal_pass, vertical, 0)
+            result = vertical_pass if result is None else result + vertical_pass
 
-    return input
+        result += 0.5
+        np.clip(result, 0, 255, out=result)
+        output[top:top + len(result)] = result
 
+    return _as_kind(input, output)
+
+@lru_cache(maxsize=256)
+def _threshold_table(threshold: int) -> tuple:
+    return tuple(255 if value >= threshold else 0 for value in range(256))
+
+@lru_cache(maxsize=256)
+def _threshold_array(threshold: int) -> np.ndarray:
+    return np.array(_threshold_table(threshold), dtype=np.uint8)
+
+@profiled
 def thresholding(input: Image.Image, threshold: int = None) -> Image.Image:
     if threshold is None:
         threshold = 128
 
+    if isinstance(input, np.ndarray):
+        return _threshold_array(threshold)[_plane(input)]
+
     output = input.convert("L")
+    return output.point(_threshold_table(threshold))
 
-    pixel_data = output.getdata()
-    modified_pixels = []
+@profiled
+def multi_thresholding(input: Image.Image, thresholds: list) -> list:
+    # one grayscale conversion shared by every mask
+    if isinstance(input, np.ndarray):
+        plane = _plane(input)
+        return [_threshold_array(threshold)[plane] for threshold in thresholds]
 
-    for pixel in pixel_data:
-        if(pixel >= threshold):
-            modified_pixels.append(255)
-        else:
-            modified_pixels.append(0)
+    output = input.convert("L")
+    return [output.point(_threshold_table(threshold)) for threshold in thresholds]
 
-    output.putdata(modified_pixels)
-    return output
+operators = {}
+# operators whose output depends on more than a small neighbourhood and can't be tiled
+global_operators = set()
+
+def edge_operator(name: str, local: bool = True):
+    def register(function):
+        operators[name] = function
+        if not local:
+            global_operators.add(name)
+        return function
+
+    return register
+
+def gradient(input, operator: str = None, power: float = None) -> Image.Image:
+    if operator is None:
+        operator = "prewitt"
+
+    if operator not in operators:
+        raise ValueError(f"Unknown edge operator '{operator}', expected one of {', '.join(operators)}")
+
+    return operators[operator](input, power)
+
+def _grayscale(input) -> np.ndarray:
+    return _plane(input).astype(np.float32)
+
+def _edge_image(input, magnitude: np.ndarray):
+    # saturates to 8 bits and inverts in place, dark lines on white
+    if magnitude.dtype != np.uint8:
+        np.clip(magnitude, 0, 255, out=magnitude)
+        magnitude = magnitude.astype(np.uint8)
+
+    np.subtract(255, magnitude, out=magnitude)
+
+    return _as_kind(input, magnitude)
+
+def _derivative(image: np.ndarray, weights: tuple, power: float) -> np.ndarray:
+    # 3x3 derivative kernels split into a smoothing pass and a central difference,
+    # the saturated magnitude of pixel (i, j) is stored at (i - 1, j - 1)
+    a, b, c = weights
+    h, w = image.shape
 
+    # smoothing weights are normalized to the prewitt scale so thresholds carry over
+    power = power * 3 / (a + b + c)
+    magnitude = np.zeros((h, w), dtype=np.uint8)
+
+    if h < 3 or w < 3:
+        return magnitude
+
+    # only row blocks leave uint8, the sums are exact integers in float32 and the root
+    # and scaling are done in float64 so the rounding matches the original per pixel version
+    for top in range(0, h - 2, 256):
+        rows = image[top:top + 258].astype(np.float32)
+        vertical_sum = a * rows[:-2] + b * rows[1:-1] + c * rows[2:]
+        horizontal_sum = a * rows[:, :-2] + b * rows[:, 1:-1] + c * rows[:, 2:]
+
+        horizontalGrad = (vertical_sum[:, 2:] - vertical_sum[:, :-2]).astype(np.float64)
+        verticalGrad = (horizontal_sum[2:] - horizontal_sum[:-2]).astype(np.float64)
+
+        block = horizontalGrad * horizontalGrad
+        block += verticalGrad * verticalGrad
+        np.sqrt(block, out=block)
+        block *= power
+
+        block = block.astype(np.float32)
+        np.clip(block, 0, 255, out=block)
+        magnitude[top:top + len(block), :w - 2] = block
+
+    return magnitude
+
+@edge_operator("prewitt")
+@profiled
 def prewitt(input: Image.Image, power: float = None) -> Image.Image:
-    input = input.convert('L')
-    image = np.array(input).astype(np.uint8)
+    if power is None:
+        power = 1.0
+
+    return _edge_image(input, _derivative(_plane(input), (1, 1, 1), power))
+
+@edge_operator("sobel")
+@profiled
+def sobel(input: Image.Image, power: float = None) -> Image.Image:
+    if power is None:
+        power = 1.0
+
+    return _edge_image(input, _derivative(_plane(input), (1, 2, 1), power))
 
+@edge_operator("scharr")
+@profiled
+def scharr(input: Image.Image, power: float = None) -> Image.Image:
     if power is None:
         power = 1.0
 
-    # Prewitt Operator
+    return _edge_image(input, _derivative(_plane(input), (3, 10, 3), power))
+
+@edge_operator("laplacian")
+@profiled
+def laplacian(input: Image.Image, power: float = None) -> Image.Image:
+    if power is None:
+        power = 1.0
+
+    image = _grayscale(input)
     h, w = image.shape
-    horizontal = np.array([[-1, 0, 1], [-1, 0, 1], [-1, 0, 1]])
-    vertical = np.array([[-1, -1, -1], [0, 0, 0], [1, 1, 1]])
-
-    newgradientImage = np.zeros((h, w))
-
-    # offset by 1
-    for i in range(1, h - 1):
-        for j in range(1, w - 1):
-            horizontalGrad = (horizontal[0, 0] * image[i - 1, j - 1]) + \
-                            (horizontal[0, 1] * image[i - 1, j]) + \
-                            (horizontal[0, 2] * image[i - 1, j + 1]) + \
-                            (horizontal[1, 0] * image[i, j - 1]) + \
-                            (horizontal[1, 1] * image[i, j]) + \
-                            (horizontal[1, 2] * image[i, j + 1]) + \
-                            (horizontal[2, 0] * image[i + 1, j - 1]) + \
-                            (horizontal[2, 1] * image[i + 1, j]) + \
-                            (horizontal[2, 2] * image[i + 1, j + 1])
-
-            verticalGrad = (vertical[0, 0] * image[i - 1, j - 1]) + \
-                        (vertical[0, 1] * image[i - 1, j]) + \
-                        (vertical[0, 2] * image[i - 1, j + 1]) + \
-                        (vertical[1, 0] * image[i, j - 1]) + \
-                        (vertical[1, 1] * image[i, j]) + \
-                        (vertical[1, 2] * image[i, j + 1]) + \
-                        (vertical[2, 0] * image[i + 1, j - 1]) + \
-                        (vertical[2, 1] * image[i + 1, j]) + \
-                        (vertical[2, 2] * image[i + 1, j + 1])
-
-            # Edge Magnitude
-            mag = np.sqrt(pow(horizontalGrad, 2.0) + pow(verticalGrad, 2.0)) * power
-            newgradientImage[i - 1, j - 1] = mag
-
-    image = Image.fromarray(newgradientImage)
-    image = image.convert("L")
-    image = ImageOps.invert(image)
-
-    return image
+    magnitude = np.zeros((h, w), dtype=np.float32)
+
+    if h < 3 or w < 3:
+        return _edge_image(input, magnitude)
+
+    # 3x3 gaussian blur followed by the 4 neighbour laplacian
+    padded = np.pad(image, 1, mode="reflect")
+    blurred = padded[:-2] + 2 * padded[1:-1] + padded[2:]
+    blurred = blurred[:, :-2] + 2 * blurred[:, 1:-1] + blurred[:, 2:]
+
+    center = blurred[1:-1, 1:-1]
+    response = blurred[:-2, 1:-1] + blurred[2:, 1:-1] + blurred[1:-1, :-2] + blurred[1:-1, 2:] - 4 * center
+
+    np.abs(response, out=response)
+    response *= power / 16
+    magnitude[:h - 2, :w - 2] = response
+
+    return _edge_image(input, magnitude)
+
+def _connected(mask: np.ndarray, seeds: np.ndarray) -> np.ndarray:
+    # the pixels of mask 8-connected to a seed, labeled in one pass over the pairs of neighbouring
+    # pixels by a union find that hooks roots to the smaller label and compresses paths in arrays
+    h, w = mask.shape
+    nodes = np.full((h, w), -1, dtype=np.int64)
+    count = int(np.count_nonzero(mask))
+    nodes[mask] = np.arange(count)
+
+    # right, down, down right and down left neighbours, each pair once
+    pairs = [
+        (nodes[:, :-1], nodes[:, 1:]),
+        (nodes[:-1], nodes[1:]),
+        (nodes[:-1, :-1], nodes[1:, 1:]),
+        (nodes[:-1, 1:], nodes[1:, :-1]),
+    ]
+    first = np.concatenate([a[(a >= 0) & (b >= 0)] for a, b in pairs])
+    second = np.concatenate([b[(a >= 0) & (b >= 0)] for a, b in pairs])
+
+    parent = np.arange(count)
+    while True:
+        a, b = parent[first], parent[second]
+        split = a != b
+        if not split.any():
+            break
+
+        first, second = first[split], second[split]
+        np.minimum.at(parent, np.maximum(a[split], b[split]), np.minimum(a[split], b[split]))
+
+        while True:
+            root = parent[parent]
+            if np.array_equal(root, parent):
+                break
+            parent = root
+
+    kept = np.zeros(count, dtype=bool)
+    kept[parent[nodes[seeds]]] = True
+
+    connected = np.zeros((h, w), dtype=bool)
+    connected[mask] = kept[parent]
+    return connected
+
+@edge_operator("canny", local=False)
+@profiled
+def canny(input: Image.Image, power: float = None, low: int = None, high: int = None) -> Image.Image:
+    if power is None:
+        power = 1.0
 
-def alpha_removal(input: Image.Image) -> Image.Image:
-    input = input.convert("RGBA")
+    if low is None:
+        low = 100
+
+    if high is None:
+        high = 200
+
+    image = _grayscale(input)
+    h, w = image.shape
+    magnitude = np.zeros((h, w), dtype=np.float32)
+
+    if h < 3 or w < 3:
+        return _edge_image(input, magnitude)
 
-    pixel_data = input.getdata()
-    modified_pixels = []
+    vertical_sum = image[:-2] + 2 * image[1:-1] + image[2:]
+    horizontal_sum = image[:, :-2] + 2 * image[:, 1:-1] + image[:, 2:]
+    horizontalGrad = vertical_sum[:, 2:] - vertical_sum[:, :-2]
+    verticalGrad = horizontal_sum[2:] - horizontal_sum[:-2]
 
-    for pixel in pixel_data:
-        red, green, blue, alpha = pixel
+    strength = np.sqrt(horizontalGrad * horizontalGrad + verticalGrad * verticalGrad)
+    strength *= power
 
-        if alpha < 255:
-            value = (255 - alpha)
-            modified_pixels.append((red + value, green + value, blue + value))
-        else:
-            modified_pixels.append((red, green, blue))
+    # non maximum suppression along the gradient direction quantized to 45 degrees
+    padded = np.pad(strength, 1)
+    x, y = np.abs(horizontalGrad), np.abs(verticalGrad)
+    across = y <= x * 0.4142
+    along = x <= y * 0.4142
+    falling = ~(across | along) & (horizontalGrad * verticalGrad > 0)
+    rising = ~(across | along | falling)
 
-    input = Image.new("RGB", input.size)
-    input.putdata(modified_pixels)
+    neighbours = [
+        (across, padded[1:-1, :-2], padded[1:-1, 2:]),
+        (along, padded[:-2, 1:-1], padded[2:, 1:-1]),
+        (falling, padded[:-2, :-2], padded[2:, 2:]),
+        (rising, padded[:-2, 2:], padded[2:, :-2]),
+    ]
 
-    return input
+    maximum = np.zeros(strength.shape, dtype=bool)
+    for direction, before, after in neighbours:
+        maximum |= direction & (strength >= before) & (strength > after)
 
-def resize(input: Image.Image, factor: float):
+    # hysteresis, keep the weak edges connected to a strong one
+    weak = maximum & (strength >= low)
+    edges = _connected(weak, weak & (strength >= high))
+
+    magnitude[:h - 2, :w - 2] = edges * 255.0
+
+    return _edge_image(input, magnitude)
+
+def _rows(input: Image.Image, mode: str, step: int = 256):
+    # converts and yields the image a strip of rows at a time so no full size
+    # intermediate other than the output has to be held
     width, height = input.size
-    return input.resize((int(width * factor), int(height * factor)))
 
-def lineart(input: Image.Image, power: float = None, threshold: int = None) -> Image.Image:
+    for top in range(0, height, step):
+        box = (0, top, width, min(top + step, height))
+        yield box, np.asarray(input.crop(box).convert(mode))
+
+@profiled
+def alpha_removal(input: Image.Image) -> Image.Image:
+    if "A" not in input.getbands() and "transparency" not in input.info:
+        return input.convert("RGB")
+
+    output = Image.new("RGB", input.size)
+
+    for box, pixels in _rows(input, "RGBA"):
+        # saturating color + (255 - alpha) without leaving uint8
+        color = 255 - pixels[..., :3]
+        np.minimum(color, 255 - pixels[..., 3:], out=color)
+        color += pixels[..., :3]
+
+        output.paste(Image.fromarray(color), box)
+
+    return output
+
+@profiled
+def resize(input: Image.Image, factor: float, box: tuple = None, source_size: tuple = None):
+    # source_size is the size factor applies to, when input was decoded at a reduced size
+    width, height = input.size
+    base = input.size if source_size is None else source_size
+    size = (int(base[0] * factor), int(base[1] * factor))
+
+    if box is None:
+        return input.resize(size)
+
+    # only the part of the resized image inside box, equal to a crop of the full resize up to rounding
+    x, y = width / size[0], height / size[1]
+    left, top, right, bottom = box
+    return input.resize((right - left, bottom - top), box=(left * x, top * y, right * x, bottom * y))
+
+@profiled
+def working_copy(input: Image.Image, limit: int = None) -> Image.Image:
+    if limit is None:
+        limit = 1280
+
+    image = _image(input)
+    width, height = image.size
+    factor = limit / max(width, height, 1)
+
+    if factor >= 1:
+        return input.copy()
+
+    size = (max(int(width * factor), 1), max(int(height * factor), 1))
+    return _as_kind(input, image.resize(size, resample=Image.BOX, reducing_gap=2.0))
+
+@profiled
+def pyramid(input: Image.Image, limits: tuple = None) -> list:
+    # coarsest level first, each one reduced from the next finer level, levels that wouldn't
+    # at least halve the image are left out
+    if limits is None:
+        limits = (512, 2048)
+
+    levels = []
+    for limit in sorted(limits, reverse=True):
+        if limit * 2 <= max(_image(input).size):
+            input = working_copy(input, limit)
+            levels.insert(0, input)
+
+    return levels
+
+@profiled
+def compose(shadow: Image.Image, edge: Image.Image, tone: int = None, out: np.ndarray = None) -> Image.Image:
+    # addition(background, addition(shadow, edge)) folds into shadow + edge + tone - 510
+    if tone is None:
+        tone = 169
+
+    if out is None and not isinstance(shadow, np.ndarray):
+        return ImageChops.add(shadow, edge, 1.0, tone - 510)
+
+    # saturating uint8 arithmetic in place, on out when given, an image result shares its memory:
+    # out = shadow - min(shadow, min(255 - edge, tone) + 255 - tone)
+    result = _plane(shadow)
+    if out is None:
+        out = np.empty_like(result)
+
+    np.subtract(255, _plane(edge), out=out)
+    np.minimum(out, tone, out=out)
+    out += 255 - tone
+    np.minimum(out, result, out=out)
+    np.subtract(result, out, out=out)
+
+    return _as_kind(shadow, out)
+
+@profiled
+def preview(image: Image.Image, edge: Image.Image, shadow_threshold: int, edge_threshold: int) -> Image.Image:
+    # works on working copies and skips rasterization, meant for live slider feedback
+    shadow = thresholding(image, shadow_threshold)
+    edge = thresholding(edge, edge_threshold)
+
+    return compose(shadow, edge)
+
+def tiled(function, input: Image.Image, halo: int = None, tile: int = None, workers: int = None) -> Image.Image:
+    # runs a stage on overlapping tiles in a thread pool and stitches the centers back,
+    # the result matches function(input) as long as the stage only looks halo pixels away
+    if halo is None:
+        halo = 16
+
+    if tile is None:
+        tile = 1024
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    array = isinstance(input, np.ndarray)
+    width, height = (input.shape[1], input.shape[0]) if array else input.size
+
+    if workers < 2 or (width <= tile and height <= tile):
+        return function(input)
+
+    boxes = [(left, top, min(left + tile, width), min(top + tile, height))
+             for top in range(0, height, tile)
+             for left in range(0, width, tile)]
+
+    def run(box):
+        left, top, right, bottom = box
+        padded = (max(left - halo, 0), max(top - halo, 0), min(right + halo, width), min(bottom + halo, height))
+
+        # arrays are cut as views, no pixels are copied on the way in
+        if array:
+            result = function(input[padded[1]:padded[3], padded[0]:padded[2]])
+            return result[top - padded[1]:bottom - padded[1], left - padded[0]:right - padded[0]]
+
+        result = function(input.crop(padded))
+        return result.crop((left - padded[0], top - padded[1], right - padded[0], bottom - padded[1]))
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(workers) as pool:
+        pieces = list(pool.map(run, boxes))
+
+    if array:
+        output = np.empty((height, width) + pieces[0].shape[2:], dtype=pieces[0].dtype)
+        for (left, top, right, bottom), piece in zip(boxes, pieces):
+            output[top:bottom, left:right] = piece
+
+        return output
+
+    output = Image.new(pieces[0].mode, input.size)
+    for box, piece in zip(boxes, pieces):
+        output.paste(piece, box[:2])
+
+    return output
+
+@profiled
+def edge_map(input: Image.Image, operator: str = None, power: float = None, workers: int = None) -> Image.Image:
+    if workers is None or operator in global_operators:
+        return gradient(input, operator, power)
+
+    return tiled(lambda tile: gradient(tile, operator, power), input, workers=workers)
+
+@profiled
+def rasterized(input: Image.Image, edge: float = None, workers: int = None, engine: str = None) -> Image.Image:
+    if edge is None:
+        edge = 2
+
+    def stage(tile):
+        return rasterize(tile, edge, engine)
+
+    # fractional factors of the upscale engine don't map tile borders onto whole pixels
+    if workers is None or (engine != "native" and not float(edge).is_integer()):
+        return stage(input)
+
+    return tiled(stage, input, workers=workers)
+
+@profiled
+def layer(input: Image.Image, threshold: int = None, edge: float = None, workers: int = None,
+          engine: str = None) -> Image.Image:
+    return rasterized(thresholding(input, threshold), edge, workers, engine)
+
+@profiled
+def lineart(input: Image.Image, power: float = None, threshold: int = None, operator: str = None,
+            workers: int = None, engine: str = None) -> Image.Image:
     if threshold is None: 
         threshold = 128
 
     if power is None: 
         power = 1
 
+    if workers is not None and operator not in global_operators:
+        return tiled(lambda tile: lineart(tile, power, threshold, operator, engine=engine), input, workers=workers)
+
     dark = thresholding(input, 92)
-    dark = rasterize(dark)
+    dark = rasterize(dark, engine=engine)
 
-    prewitt_edge = prewitt(input, power)
+    prewitt_edge = gradient(input, operator, power)
     prewitt_edge = thresholding(prewitt_edge, threshold)
-    prewitt_edge = rasterize(prewitt_edge)
+    prewitt_edge = rasterize(prewitt_edge, engine=engine)
     result = addition(dark, prewitt_edge)
 
     return result
 
+@profiled
 def white_alpha(input: Image.Image) -> Image.Image:
-    input = input.convert("RGBA")
+    input = _image(input)
+    alpha = Image.new("L", input.size)
 
-    pixel_data = input.getdata()
-    modified_pixels = []
+    for box, pixels in _rows(input, "RGB"):
+        total = pixels.sum(axis=2, dtype=np.uint16)
+        alpha.paste(Image.fromarray(((765 - total) // 3).astype(np.uint8)), box)
 
-    for pixel in pixel_data:
-        red, green, blue, _ = pixel
-        alpha = 255 - (red + green + blue) / 3
-        modified_pixels.append((0, 0, 0, int(alpha)))
+    output = Image.new("RGBA", input.size, (0, 0, 0, 0))
+    output.putalpha(alpha)
 
-    input.putdata(modified_pixels)
+    return output
 
-    return input
+# export formats by file extension, group4 is picked explicitly since it shares .tif with tiff
+export_formats = {
+    ".png": "png",
+    ".webp": "webp",
+    ".tif": "tiff",
+    ".tiff": "tiff",
+}
+
+@profiled
+def export(input, path: str, format: str = None, level: int = None, transparent: bool = False,
+           pack: bool = True):
+    # writes a drawing losslessly, level trades speed for size from 0 (fastest) to 9 (smallest),
+    # pack stores bi-level drawings at one bit per pixel through a full size copy of the drawing
+    if format is None:
+        format = export_formats.get(os.path.splitext(path)[1].lower(), "png")
+
+    if level is None:
+        level = 6
+
+    if format not in ("png", "webp", "tiff", "group4"):
+        raise ValueError(f"Unknown export format '{format}', expected png, webp, tiff or group4")
+
+    # arrays from grayscale on and L images are encoded from their own pixels, which for the
+    # file backed canvas of a streamed drawing saves reading it into memory in full
+    image = _image(input)
+    if image.mode != "L":
+        image = image.convert("L")
+
+    # bi-level output is packed to one bit per pixel, group4 always thresholds at mid gray
+    bilevel = format == "group4" or pack and not any(image.histogram()[1:255])
+
+    if format == "group4":
+        if transparent:
+            raise ValueError("Group4 TIFF has no alpha channel, use png, webp or tiff for transparent ink")
+
+        image.convert("1", dither=Image.Dither.NONE).save(path, "TIFF", compression="group4")
+        return
+
+    if transparent:
+        image = white_alpha(image)
+    elif bilevel:
+        image = image.convert("1", dither=Image.Dither.NONE)
+
+    if format == "png":
+        image.save(path, "PNG", compress_level=level)
+    elif format == "webp":
+        image.save(path, "WEBP", lossless=True, quality=100, method=round(level * 6 / 9))
+    elif bilevel and not transparent:
+        image.save(path, "TIFF", compression="group4" if level else None)
+    else:
+        # TIFF has no deflate level, the scale picks between none, LZW and deflate instead
+        compression = None if level == 0 else "tiff_lzw" if level < 5 else "tiff_adobe_deflate"
+        image.save(path, "TIFF", compression=compression)
+
+_qimage_formats = {
+    "L": "Format_Grayscale8",
+    "P": "Format_Indexed8",
+    "RGB": "Format_RGB888",
+    "RGBA": "Format_RGBA8888",
+}
+
+@profiled
+def pil_to_pixmap(input) -> "QPixmap":
+    # hands the pixels to QImage at their own depth, arrays are wrapped without a copy
+    from PySide6.QtGui import QPixmap, QImage
+
+    if isinstance(input, np.ndarray):
+        data = np.ascontiguousarray(input)
+        mode = "L" if data.ndim == 2 else {3: "RGB", 4: "RGBA"}[data.shape[2]]
+        height, width = data.shape[:2]
+    else:
+        if input.mode not in _qimage_formats:
+            transparent = "A" in input.getbands() or "transparency" in input.info
+            input = input.convert("RGBA" if transparent else "RGB")
+
+        data = input.tobytes()
+        mode = input.mode
+        width, height = input.size
+
+    # the data has to outlive the QImage, which fromImage copies into the pixmap
+    bytes_per_line = width * len(mode)
+    qimage = QImage(data, width, height, bytes_per_line, getattr(QImage, _qimage_formats[mode]))
+
+    if mode == "P":
+        palette = input.getpalette("RGB")
+        qimage.setColorTable([0xFF000000 | palette[i] << 16 | palette[i + 1] << 8 | palette[i + 2]
+                              for i in range(0, len(palette), 3)])
 
-def pil_to_pixmap(input : Image.Image) -> QPixmap:
-    image_data = input.convert("RGBA").tobytes("raw", "RGBA")
-    qimage = QImage(image_data, input.size[0], input.size[1], QImage.Format_RGBA8888)
     pixmap = QPixmap.fromImage(qimage)
-    
-    return pixmap
\ No newline at end of file
+
+    return pixmap
@@ -1,18 +1,22 @@
-from PIL import Image
 from PySide6.QtWidgets import (QApplication, QWidget, QLabel, QPushButton, 
                                QVBoxLayout, QHBoxLayout, QTextEdit, QStackedLayout,
                                QFileDialog, QFileDialog, QFileIconProvider, 
                                QSizePolicy, QGraphicsView, QGraphicsScene, 
                                QGraphicsPixmapItem, QProgressBar, QSpacerItem, 
                                QDialog, QFrame, QGraphicsProxyWidget, QSlider,
-                               QGraphicsPathItem)
+                               QGraphicsPathItem, QComboBox, QTabBar, QMessageBox)
 from PySide6.QtGui import (QIcon, QPixmap, QPainter, QImage, QMouseEvent, 
                            QTransform, QMovie, QIcon, QDesktopServices, QColor,
                            QBrush, QPainterPath)
-from PySide6.QtCore import Qt, QFileInfo, QThread, Signal, QPoint, QTimer, QSize, QUrl, QRectF
+from PySide6.QtCore import (Qt, QFileInfo, QThread, Signal, QPoint, QTimer, QSize, QUrl, QRectF,
+                            QObject, QRunnable, QThreadPool)
 
 import os, sys
 import drawing as dg
+from cache import GradientCache, default_directory
+from pipeline import Pipeline
+from profiling import Profile
+from scratch import Scratch
 
 class MainWindow(QWidget):
     def __init__(self, app):
@@ -32,6 +36,7 @@ class MainWindow(QWidget):
         self.default_path = home +"/"+ "Downloads/"
 
         self.initialize_settings()
+        self.initialize_workers()
         self.initialize_ui()
         self.initialize_loading()
         self.reset_settings()
@@ -63,6 +68,10 @@ class MainWindow(QWidget):
         self.draggable_area = titlebar.rect()
         
         self.viewer = Viewport(self)
+        self.viewer.viewChanged.connect(self.view_changed)
+        self.viewer.filesDropped.connect(self.open_files)
+        self.profile_overlay = self.profile_ui()
+        self.tabs = self.tabs_ui()
         viewport_toolbar  = self.viewport_ui()
         toolbar = self.toolbar_ui()
 
@@ -71,7 +80,13 @@ class MainWindow(QWidget):
 
         self.central_layout = QHBoxLayout()
         self.central_layout.setContentsMargins(10, 5, 10, 10)
-        self.central_layout.addWidget(self.viewer)
+        self.viewer_layout = QVBoxLayout()
+        self.viewer_layout.setContentsMargins(0, 0, 0, 0)
+        self.viewer_layout.setSpacing(0)
+        self.viewer_layout.addWidget(self.tabs)
+        self.viewer_layout.addWidget(self.viewer)
+
+        self.central_layout.addLayout(self.viewer_layout)
         self.central_layout.addWidget(viewport_toolbar)
         self.central_layout.addWidget(toolbar)
 
@@ -96,12 +111,48 @@ class MainWindow(QWidget):
             """
         )
 
+    def initialize_workers(self):
+        # one pool for every open document, bounded so a drop of many files doesn't decode them all
+        # at once, the jobs of the document on screen go first and each document keeps at most one
+        # job waiting, a newer job takes its place
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(2)
+        self.workers = {}
+        self.job = 0
+
+        # the open documents each keep their own pipeline, gradient maps of images drawn before are
+        # read back from the shared cache instead of recomputed
+        self.cache = GradientCache(default_directory())
+        self.scratch = None
+        self.documents = []
+        self.document = None
+
+        # exports run next to renders in their own pool and are never superseded
+        self.export_pool = QThreadPool()
+        self.export_pool.setMaxThreadCount(1)
+        self.exports = {}
+        self.export_job = 0
+
+        # panning and zooming settle before the visible part is drawn again
+        self.view_timer = QTimer(self)
+        self.view_timer.setSingleShot(True)
+        self.view_timer.setInterval(200)
+        self.view_timer.timeout.connect(self.render_region)
+
     def initialize_settings(self):
         self.loading = False
         self.resize_factor = 1.5
         self.rasterize_edge = 2
         self.shadow_threshold = 72
         self.prewitt_threshold = 164
+        self.operator = "prewitt"
+        self.rendering = "whole"
+        self.ink = "white"
+        self.compression = 6
+        self.profiling = False
+        self.intermediates = "memory"
+        self.profile = None
+        self.tile_workers = os.cpu_count()
 
     def reset_settings(self):
         self.resize_factor = 1.5
@@ -116,6 +167,11 @@ class MainWindow(QWidget):
         self.prewitt_threshold = 164
         self.prewitt_slider.setValue(164)
 
+        self.operator_box.setCurrentIndex(self.operator_box.findData("prewitt"))
+
+        self.compression = 6
+        self.compression_slider.setValue(6)
+
     def titlebar_ui(self) -> QWidget:
         app_icon = QPixmap("Files/Icons/icon.png")
         app_icon = app_icon.scaled(30, 30, Qt.AspectRatioMode.KeepAspectRatio, Qt.SmoothTransformation)
@@ -271,11 +327,11 @@ class MainWindow(QWidget):
                                     """
                                 )
         
-        export_button = QPushButton('EXPORT')
-        export_button.setToolTip("Saves the current image")
-        export_button.setFixedSize(205, 40)
-        # export_button.clicked.connect(self.export_file)
-        export_button.setStyleSheet(
+        self.export_button = QPushButton('EXPORT')
+        self.export_button.setToolTip("Saves the current image")
+        self.export_button.setFixedSize(205, 40)
+        self.export_button.clicked.connect(self.export_file)
+        self.export_button.setStyleSheet(
                                     """
                                     QPushButton {
                                         font-size: 15px;
@@ -360,6 +416,8 @@ class MainWindow(QWidget):
                                 )
 
         self.shadow_slider = SliderInt(255)
+        self.shadow_slider.valueChange.connect(self.preview_shadow)
+        self.shadow_slider.released.connect(self.change_shadow)
 
         shadow_layout = QHBoxLayout()
         shadow_layout.addSpacing(5)
@@ -425,6 +483,8 @@ class MainWindow(QWidget):
                                 )
 
         self.prewitt_slider = SliderInt(255)
+        self.prewitt_slider.valueChange.connect(self.preview_prewitt)
+        self.prewitt_slider.released.connect(self.change_prewitt)
 
         prewitt_layout = QHBoxLayout()
         prewitt_layout.addSpacing(5)
@@ -451,6 +511,7 @@ class MainWindow(QWidget):
 
         self.scaling_slider = SliderFloat(50, 10)
         self.scaling_slider.valueChange.connect(self.change_scaling)
+        self.scaling_slider.released.connect(self.update_drawing)
 
         scaling_layout = QHBoxLayout()
         scaling_layout.addSpacing(5)
@@ -476,6 +537,7 @@ class MainWindow(QWidget):
 
         self.rasterize_slider = SliderFloat(50, 10)
         self.rasterize_slider.valueChange.connect(self.change_rasterization)
+        self.rasterize_slider.released.connect(self.update_drawing)
 
         rasterize_layout = QHBoxLayout()
         rasterize_layout.addSpacing(5)
@@ -484,6 +546,145 @@ class MainWindow(QWidget):
         rasterize_layout.addWidget(self.rasterize_slider)
         rasterize_layout.addSpacing(5)
 
+        operator_caption = QLabel("Operator")
+        operator_caption.setAlignment(Qt.AlignRight)
+        operator_caption.setToolTip("Edge detection operator used for the edge layer")
+        operator_caption.setFixedWidth(100)
+        operator_caption.setStyleSheet(
+                                    """
+                                    QLabel
+                                    {
+                                        color: #A0A0A0; 
+                                        font-size: 17px; 
+                                        font-weight: 600;
+                                    }
+                                    """
+                                )
+
+        self.operator_box = QComboBox()
+        for name in dg.operators:
+            self.operator_box.addItem(name.capitalize(), name)
+        self.operator_box.currentIndexChanged.connect(self.change_operator)
+        self.operator_box.setStyleSheet(
+                                    """
+                                    QComboBox {
+                                        font-size: 15px;
+                                        font-weight: 600;
+                                        padding: 4px 8px;
+                                        border-radius: 5px;
+
+                                        background-color: #151515;
+                                        border: 1px solid #555555;
+                                        color: #CCCCCC;
+                                    }
+
+                                    QComboBox QAbstractItemView {
+                                        background-color: #151515;
+                                        color: #CCCCCC;
+                                        selection-background-color: #8080AA;
+                                    }
+                                    """
+                                )
+
+        operator_layout = QHBoxLayout()
+        operator_layout.addSpacing(5)
+        operator_layout.addWidget(operator_caption)
+        operator_layout.setAlignment(operator_caption, Qt.AlignVCenter)
+        operator_layout.addWidget(self.operator_box)
+        operator_layout.addSpacing(5)
+
+        rendering_caption = QLabel("Rendering")
+        rendering_caption.setAlignment(Qt.AlignRight)
+        rendering_caption.setToolTip("Draws only the visible part at full resolution while zoomed in, the rest follows when zoomed out")
+        rendering_caption.setFixedWidth(100)
+        rendering_caption.setStyleSheet(operator_caption.styleSheet())
+
+        self.rendering_box = QComboBox()
+        self.rendering_box.addItem("Whole image", "whole")
+        self.rendering_box.addItem("Visible area", "visible")
+        self.rendering_box.currentIndexChanged.connect(self.change_rendering)
+        self.rendering_box.setStyleSheet(self.operator_box.styleSheet())
+
+        rendering_layout = QHBoxLayout()
+        rendering_layout.addSpacing(5)
+        rendering_layout.addWidget(rendering_caption)
+        rendering_layout.setAlignment(rendering_caption, Qt.AlignVCenter)
+        rendering_layout.addWidget(self.rendering_box)
+        rendering_layout.addSpacing(5)
+
+        ink_caption = QLabel("Ink")
+        ink_caption.setAlignment(Qt.AlignRight)
+        ink_caption.setToolTip("Exports the lines on white paper or as black ink on a transparent background")
+        ink_caption.setFixedWidth(100)
+        ink_caption.setStyleSheet(operator_caption.styleSheet())
+
+        self.ink_box = QComboBox()
+        self.ink_box.addItem("On white", "white")
+        self.ink_box.addItem("Transparent", "transparent")
+        self.ink_box.currentIndexChanged.connect(self.change_ink)
+        self.ink_box.setStyleSheet(self.operator_box.styleSheet())
+
+        ink_layout = QHBoxLayout()
+        ink_layout.addSpacing(5)
+        ink_layout.addWidget(ink_caption)
+        ink_layout.setAlignment(ink_caption, Qt.AlignVCenter)
+        ink_layout.addWidget(self.ink_box)
+        ink_layout.addSpacing(5)
+
+        compression_caption = QLabel("Compression")
+        compression_caption.setAlignment(Qt.AlignRight)
+        compression_caption.setToolTip("Compression of exported files, higher values give smaller files but take longer to write")
+        compression_caption.setFixedWidth(100)
+        compression_caption.setStyleSheet(operator_caption.styleSheet())
+
+        self.compression_slider = SliderInt(9)
+        self.compression_slider.valueChange.connect(self.change_compression)
+
+        compression_layout = QHBoxLayout()
+        compression_layout.addSpacing(5)
+        compression_layout.addWidget(compression_caption)
+        compression_layout.setAlignment(compression_caption, Qt.AlignVCenter)
+        compression_layout.addWidget(self.compression_slider)
+        compression_layout.addSpacing(5)
+
+        intermediates_caption = QLabel("Intermediates")
+        intermediates_caption.setAlignment(Qt.AlignRight)
+        intermediates_caption.setToolTip("Keeps the stages of large images in scratch files the system can page out, instead of in memory")
+        intermediates_caption.setFixedWidth(100)
+        intermediates_caption.setStyleSheet(operator_caption.styleSheet())
+
+        self.intermediates_box = QComboBox()
+        self.intermediates_box.addItem("In memory", "memory")
+        self.intermediates_box.addItem("Scratch files", "scratch")
+        self.intermediates_box.currentIndexChanged.connect(self.change_intermediates)
+        self.intermediates_box.setStyleSheet(self.operator_box.styleSheet())
+
+        intermediates_layout = QHBoxLayout()
+        intermediates_layout.addSpacing(5)
+        intermediates_layout.addWidget(intermediates_caption)
+        intermediates_layout.setAlignment(intermediates_caption, Qt.AlignVCenter)
+        intermediates_layout.addWidget(self.intermediates_box)
+        intermediates_layout.addSpacing(5)
+
+        profiling_caption = QLabel("Profiling")
+        profiling_caption.setAlignment(Qt.AlignRight)
+        profiling_caption.setToolTip("Shows where the time of the last render went, exporting as a trace saves it for chrome://tracing")
+        profiling_caption.setFixedWidth(100)
+        profiling_caption.setStyleSheet(operator_caption.styleSheet())
+
+        self.profiling_box = QComboBox()
+        self.profiling_box.addItem("Off", False)
+        self.profiling_box.addItem("Overlay", True)
+        self.profiling_box.currentIndexChanged.connect(self.change_profiling)
+        self.profiling_box.setStyleSheet(self.operator_box.styleSheet())
+
+        profiling_layout = QHBoxLayout()
+        profiling_layout.addSpacing(5)
+        profiling_layout.addWidget(profiling_caption)
+        profiling_layout.setAlignment(profiling_caption, Qt.AlignVCenter)
+        profiling_layout.addWidget(self.profiling_box)
+        profiling_layout.addSpacing(5)
+
         reset_button = QPushButton('RESET')
         reset_button.setFixedSize(120, 40)
         reset_button.setToolTip("Resets the parameters to default")
@@ -518,6 +719,12 @@ class MainWindow(QWidget):
         central_layout = QVBoxLayout()
         central_layout.addLayout(scaling_layout)
         central_layout.addLayout(rasterize_layout)
+        central_layout.addLayout(operator_layout)
+        central_layout.addLayout(rendering_layout)
+        central_layout.addLayout(ink_layout)
+        central_layout.addLayout(compression_layout)
+        central_layout.addLayout(intermediates_layout)
+        central_layout.addLayout(profiling_layout)
         central_layout.addLayout(shadow_layout)
         central_layout.addLayout(prewitt_layout)
         central_layout.addSpacing(20)
@@ -528,8 +735,8 @@ class MainWindow(QWidget):
         button_layout.addWidget(open_button)
         button_layout.setAlignment(open_button, Qt.AlignRight)
         button_layout.addSpacing(10)
-        button_layout.addWidget(export_button)
-        button_layout.setAlignment(export_button, Qt.AlignLeft)
+        button_layout.addWidget(self.export_button)
+        button_layout.setAlignment(self.export_button, Qt.AlignLeft)
 
         description = "The compile time depends on the size of the image and the parameters set."
 
@@ -660,10 +867,71 @@ class MainWindow(QWidget):
 
         return viewport_widget
     
+    def tabs_ui(self) -> QTabBar:
+        # one tab per open document, shown once there is one
+        tabs = QTabBar()
+        tabs.setTabsClosable(True)
+        tabs.setExpanding(False)
+        tabs.setDocumentMode(True)
+        tabs.setElideMode(Qt.ElideMiddle)
+        tabs.currentChanged.connect(self.switch_document)
+        tabs.tabCloseRequested.connect(self.close_document)
+        tabs.setStyleSheet(
+                                    """
+                                    QTabBar::tab {
+                                        font-size: 13px;
+                                        padding: 6px 10px;
+                                        max-width: 180px;
+                                        border-top-left-radius: 5px;
+                                        border-top-right-radius: 5px;
+
+                                        background-color: #151515;
+                                        border: 1px solid #404040;
+                                        color: #909090;
+                                    }
+
+                                    QTabBar::tab:selected {
+                                        background-color: #303030;
+                                        color: #CCCCCC;
+                                    }
+
+                                    QTabBar::tab:hover {
+                                        color: #8080AA;
+                                    }
+                                    """
+                                )
+        tabs.hide()
+
+        return tabs
+
+    def profile_ui(self) -> QLabel:
+        # laid over the top left corner of the viewport, never takes the mouse from it
+        overlay = QLabel(self.viewer)
+        overlay.move(10, 10)
+        overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+        overlay.setStyleSheet(
+                                    """
+                                    QLabel
+                                    {
+                                        color: #CCCCCC;
+                                        background-color: rgba(21, 21, 21, 200);
+                                        border: 1px solid #555555;
+                                        border-radius: 5px;
+                                        font-family: monospace;
+                                        font-size: 12px;
+                                        padding: 6px 8px;
+                                    }
+                                    """
+                                )
+        overlay.hide()
+
+        return overlay
+
     def start_loading(self):
-        self.loading = True
-        self.loading_icon.start_animation()
-        self.loading_icon.show()
+        if not self.loading:
+            self.loading = True
+            self.loading_icon.start_animation()
+            self.loading_icon.show()
 
     def stop_loading(self):
         self.loading = False
@@ -672,56 +940,386 @@ class MainWindow(QWidget):
 
     #worker thread
     def open_file(self):
-        if not self.loading:
-            path = QFileDialog.getOpenFileName(self, "Open File", self.default_path, "All Files (*);; PNG Files (*.png);; JPG Files (*.jpg)")
-            
-            if not path[0] == "":
-                self.image = Image.open(path[0])
-                self.image = dg.alpha_removal(self.image)
+        paths, _ = QFileDialog.getOpenFileNames(self, "Open Files", self.default_path, "All Files (*);; PNG Files (*.png);; JPG Files (*.jpg)")
+        self.open_files(paths)
+
+    def open_files(self, paths: list):
+        # every file becomes a document of its own, the first one is shown while all of them
+        # are decoded in the shared pool
+        opened = []
+        for path in paths:
+            try:
+                document = Document(path, self.cache, self.tile_workers, self.scratch)
+            except (OSError, ValueError) as error:
+                print(f"{path}: {error}", file=sys.stderr)
+                continue
+
+            self.documents.append(document)
+            opened.append(document)
+
+            index = self.tabs.addTab(document.name)
+            self.tabs.setTabToolTip(index, path)
+
+        if not opened:
+            return
+
+        self.tabs.show()
+        self.tabs.setCurrentIndex(self.documents.index(opened[0]))
+
+        for document in opened:
+            self.load(document)
+
+    def load(self, document):
+        # decoded at the resolution the current scale needs, upright and in sRGB, together with
+        # the smaller copies a render draws first
+        parameters, pipeline, workers = self.parameters(), document.pipeline, self.tile_workers
+
+        def job() -> tuple:
+            image = pipeline.evaluate(parameters, "opaque")["opaque"]
+            return image, [Pipeline(level, workers=workers) for level in dg.pyramid(image)]
+
+        def loaded(result: tuple):
+            document.photo, document.levels = result
+
+            if document is self.document:
+                self.show_document()
+
+        self.submit(document, job, loaded)
+
+    def switch_document(self, index: int):
+        document = self.documents[index] if index >= 0 else None
+        if document is self.document:
+            return
+
+        previous, self.document = self.document, document
+        self.view_timer.stop()
+
+        # a job still waiting in the pool moves up or down with the document it belongs to
+        for document in (previous, self.document):
+            if document is not None and document.worker is not None and self.pool.tryTake(document.worker):
+                self.pool.start(document.worker, self.priority(document))
 
-                pixmap = dg.pil_to_pixmap(self.image)
-                self.viewer.setPhoto(pixmap)
+        self.show_document()
 
-                self.shadow = None
-                self.prewitt = None
+    def close_document(self, index: int):
+        document = self.documents.pop(index)
 
-                self.run_button.setEnabled(True)
-                self.shadow_button.setEnabled(False)
-                self.prewitt_button.setEnabled(False)
+        if document.worker is not None and self.pool.tryTake(document.worker):
+            self.workers.pop(document.job, None)
+        document.job, document.worker = None, None
+
+        self.tabs.removeTab(index)
+        self.tabs.setVisible(bool(self.documents))
+
+    def show_document(self):
+        document = self.document
+
+        if document is None:
+            self.viewer.setPhoto()
+        elif document.drawing is not None:
+            self.viewer.setPhoto(dg.pil_to_pixmap(document.drawing))
+        elif document.photo is not None:
+            self.viewer.setPhoto(dg.pil_to_pixmap(document.photo))
+        else:
+            self.viewer.setPhoto()
+
+        self.update_buttons()
+        self.update_loading()
+
+        # a document drawn before is brought up to the parameters set since, from its own stages
+        if document is not None and document.preview_image is not None:
+            if document.drawing is None or document.parameters != self.parameters():
+                self.render()
+
+    def update_buttons(self):
+        document = self.document
+        drawn = document is not None and document.preview_image is not None
+
+        self.run_button.setEnabled(document is not None and document.photo is not None and not drawn)
+        self.shadow_button.setEnabled(drawn)
+        self.prewitt_button.setEnabled(drawn)
+
+    def update_loading(self):
+        if self.document is not None and self.document.job is not None:
+            self.start_loading()
+        elif self.loading:
+            self.stop_loading()
+
+    def export_file(self):
+        document = self.document
+        if document is None or document.preview_image is None:
+            return
+
+        formats = {
+            "PNG Files (*.png)": ("png", ".png"),
+            "WebP Files (*.webp)": ("webp", ".webp"),
+            "TIFF Files (*.tif *.tiff)": ("tiff", ".tif"),
+            "1-bit Group4 TIFF Files (*.tif *.tiff)": ("group4", ".tif"),
+        }
+
+        # group4 has no alpha channel to hold transparent ink
+        if self.ink == "transparent":
+            del formats["1-bit Group4 TIFF Files (*.tif *.tiff)"]
+
+        # the stages of the last render, for chrome://tracing or Perfetto
+        if self.profile is not None:
+            formats["Chrome Trace Files (*.json)"] = ("trace", ".json")
+
+        path, selected = QFileDialog.getSaveFileName(self, "Export File", self.default_path, ";;".join(formats))
+
+        if not path == "":
+            format, extension = formats.get(selected, (None, ".png"))
+            if not os.path.splitext(path)[1]:
+                path += extension
+
+            if format == "trace":
+                self.profile.save(path)
+                return
+
+            # a drawing left unfinished off screen is completed by the export itself
+            parameters, pipeline = self.parameters(), document.pipeline
+            level, transparent = self.compression, self.ink == "transparent"
+
+            def job() -> str:
+                drawing = pipeline.evaluate(parameters, "drawing")["drawing"]
+                dg.export(drawing, path, format, level, transparent)
+                return path
+
+            self.export_job += 1
+            worker = Worker(self.export_job, job, None)
+            self.exports[worker.job] = worker
+            worker.signals.finished.connect(self.export_finished)
+            worker.signals.failed.connect(self.export_failed)
+
+            self.export_button.setText("EXPORTING")
+            self.export_pool.start(worker)
+
+    def export_finished(self, job: int, path: str):
+        self.exports.pop(job, None)
+
+        if not self.exports:
+            self.export_button.setText("EXPORT")
+
+    def export_failed(self, job: int, message: str):
+        self.export_finished(job, None)
+        print(message, file=sys.stderr)
+        QMessageBox.warning(self, "Export failed", message)
 
     def refresh_viewer(self):
-        pixmap = dg.pil_to_pixmap(self.drawing)
+        pixmap = dg.pil_to_pixmap(self.document.drawing)
         self.viewer.setPhoto(pixmap)
 
-    def create_shadow(self):
-        self.shadow = dg.thresholding(self.image, self.shadow_threshold)
-        self.shadow = dg.rasterize(self.shadow, self.rasterize_edge)
+    def priority(self, document) -> int:
+        return 1 if document is self.document else 0
+
+    def submit(self, document, function, callback):
+        # the stages a job runs are recorded while profiling, shown once its result is
+        if self.profiling:
+            profile, run, show = Profile(), function, callback
+
+            def function():
+                with profile:
+                    return run()
 
-    def create_prewitt(self):
-        self.prewitt = dg.thresholding(self.prewitt_edge, self.prewitt_threshold)
-        self.prewitt = dg.rasterize(self.prewitt, self.rasterize_edge)
+            def callback(result):
+                self.show_profile(profile)
+                show(result)
 
-    def render_drawing(self):
-        background = Image.new("L", self.image.size, 169)
+        # a newer job of a document takes the place of its job still waiting in the pool
+        if document.worker is not None and self.pool.tryTake(document.worker):
+            del self.workers[document.worker.job]
 
-        self.drawing = dg.addition(self.shadow, self.prewitt)
-        self.drawing = dg.addition(background, self.drawing)
+        self.job += 1
+        worker = Worker(self.job, function, callback)
+        self.workers[self.job] = worker
+        document.job, document.worker = self.job, worker
+        worker.signals.finished.connect(self.job_finished)
+        worker.signals.failed.connect(self.job_failed)
 
-        self.refresh_viewer()
+        self.pool.start(worker, self.priority(document))
+        self.update_loading()
+
+    def owner(self, job: int):
+        # the open document job is the latest of, None for superseded jobs and closed documents
+        return next((document for document in self.documents if document.job == job), None)
+
+    def job_finished(self, job: int, result):
+        # results of superseded jobs are dropped
+        worker = self.workers.pop(job, None)
+        document = self.owner(job)
+
+        if document is not None:
+            document.job, document.worker = None, None
+            worker.callback(result)
+
+        self.update_loading()
+
+    def job_failed(self, job: int, message: str):
+        self.workers.pop(job, None)
+        document = self.owner(job)
+
+        if document is not None:
+            document.job, document.worker = None, None
+            print(f"{document.path}: {message}", file=sys.stderr)
+
+        self.update_loading()
+
+    def show_profile(self, profile: Profile):
+        self.profile = profile
+
+        lines = [f"{'stage':<18}{'calls':>6}{'ms':>8}{'cpu ms':>8}{'MB':>8}{'MP':>8}"]
+        # stages that only wait on the ones inside them are left to the trace
+        for row in [row for row in profile.summary() if row["self"] >= 0.0005][:12]:
+            lines.append(f"{row['name']:<18}{row['calls']:>6}{row['self'] * 1000:>8.0f}{row['cpu'] * 1000:>8.0f}"
+                         f"{row['bytes'] / 2 ** 20:>8.1f}{row['pixels'] / 1e6:>8.1f}")
+        lines.append(f"{'total':<18}{'':>6}{profile.elapsed * 1000:>8.0f}")
+
+        self.profile_overlay.setText("\n".join(lines))
+        self.profile_overlay.adjustSize()
+        self.profile_overlay.setVisible(self.profiling)
+
+    def parameters(self) -> dict:
+        return {
+            "scale": self.resize_factor,
+            "edge": self.rasterize_edge,
+            "shadow_threshold": self.shadow_threshold,
+            "edge_threshold": self.prewitt_threshold,
+            "operator": self.operator,
+        }
+
+    def render(self, level: int = 0, document=None):
+        # the parameters are captured here, the worker never touches the window and the
+        # pipeline only recomputes the stages they made stale
+        if document is None:
+            document = self.document
+
+        if document is None:
+            return
+
+        parameters = self.parameters()
+
+        # coarse levels only replace what is on screen, each one queues the next finer level,
+        # documents off screen go straight to the full drawing
+        if level < len(document.levels) and document is self.document:
+            pipeline = document.levels[level]
+
+            def job() -> dict:
+                return pipeline.evaluate(parameters, "drawing")
+
+            def refine(result: dict):
+                if document is not self.document:
+                    self.render(len(document.levels), document)
+                    return
+
+                self.viewer.setPreview(dg.pil_to_pixmap(result["drawing"]))
+
+                if self.visible_box() is not None:
+                    self.render_region()
+                else:
+                    self.render(level + 1)
+
+            self.submit(document, job, refine)
+        else:
+            pipeline = document.pipeline
+
+            def job() -> dict:
+                return pipeline.evaluate(parameters, "drawing", "preview_image", "preview_edge")
+
+            def apply(result: dict):
+                self.apply_layers(document, parameters, result)
+
+            self.submit(document, job, apply)
+
+    def visible_box(self):
+        # the visible part of the drawing in its own pixels, when it is worth drawing on its own
+        document = self.document
+        if self.rendering != "visible" or document is None or not document.levels:
+            return None
+
+        rect = self.viewer.visibleRect()
+        if rect is None or rect.width() * rect.height() > 0.5:
+            return None
+
+        width, height = (int(side * self.resize_factor) for side in document.image_size)
+        return (int(rect.left() * width), int(rect.top() * height),
+                min(int(rect.right() * width) + 1, width), min(int(rect.bottom() * height) + 1, height))
+
+    def render_region(self):
+        # the visible part at full resolution, the rest is drawn once the view takes it in
+        document, box = self.document, self.visible_box()
+        if box is None:
+            if document is not None:
+                self.render(len(document.levels))
+            return
+
+        parameters, pipeline, level = self.parameters(), document.pipeline, document.levels[0]
+        width, height = (int(side * self.resize_factor) for side in document.image_size)
+
+        def job() -> dict:
+            result = level.evaluate(parameters, "preview_image", "preview_edge")
+            result["region"] = pipeline.region(parameters, box)
+            return result
+
+        def show(result: dict):
+            region = result.pop("region")
+
+            document.drawing = None
+            document.parameters = parameters
+            document.preview_image = result["preview_image"]
+            document.preview_edge = result["preview_edge"]
+
+            if document is self.document:
+                left, top, right, bottom = box
+                rect = QRectF(left / width, top / height, (right - left) / width, (bottom - top) / height)
+                self.viewer.setRegion(dg.pil_to_pixmap(region), rect)
+                self.update_buttons()
+
+        self.submit(document, job, show)
+
+    def view_changed(self):
+        # only a drawing left unfinished off screen needs the new view
+        document = self.document
+        if document is not None and document.drawing is None and document.preview_image is not None:
+            self.view_timer.start()
+
+    def apply_layers(self, document, parameters: dict, result: dict):
+        for name, value in result.items():
+            setattr(document, name, value)
+        document.parameters = parameters
+
+        if document is self.document:
+            self.refresh_viewer()
+            self.update_buttons()
+
+    def render_preview(self):
+        document = self.document
+        preview = dg.preview(document.preview_image, document.preview_edge,
+                             self.shadow_slider.getValue(), self.prewitt_slider.getValue())
+
+        pixmap = dg.pil_to_pixmap(preview)
+        self.viewer.setPreview(pixmap)
+
+    def preview_shadow(self, value: int):
+        if self.document is not None and self.document.preview_image is not None:
+            self.render_preview()
+
+    def preview_prewitt(self, value: int):
+        if self.document is not None and self.document.preview_image is not None:
+            self.render_preview()
 
-    #worker thread
     def change_shadow(self):
-        if not self.loading:
+        if self.shadow_button.isEnabled():
             self.shadow_threshold = self.shadow_slider.getValue()
-            self.create_shadow()
-            self.render_drawing()
+            self.render()
     
-    #worker thread
     def change_prewitt(self):
-        if not self.loading:
+        if self.prewitt_button.isEnabled():
             self.prewitt_threshold = self.prewitt_slider.getValue()
-            self.create_prewitt()
-            self.render_drawing()
+            self.render()
+
+    def change_operator(self, index: int):
+        self.operator = self.operator_box.itemData(index)
+        self.update_drawing()
 
     def change_scaling(self, value: float):
         self.resize_factor = value
@@ -729,22 +1327,91 @@ class MainWindow(QWidget):
     def change_rasterization(self, value: float):
         self.rasterize_edge = value
 
-    #worker thread
-    def run_algorithm(self):
-        if not self.loading:
+    def change_ink(self, index: int):
+        self.ink = self.ink_box.itemData(index)
+
+    def change_compression(self, value: int):
+        self.compression = value
+
+    def change_intermediates(self, index: int):
+        # stages computed from now on go where the setting says, the ones held already stay put
+        self.intermediates = self.intermediates_box.itemData(index)
+        if self.intermediates == "scratch":
+            self.scratch = self.scratch or Scratch()
+        else:
+            self.scratch = None
+
+        for document in self.documents:
+            document.pipeline.scratch = self.scratch
+
+    def change_profiling(self, index: int):
+        self.profiling = self.profiling_box.itemData(index)
+        self.profile_overlay.setVisible(self.profiling and self.profile is not None)
 
-            self.image = dg.resize(self.image, self.resize_factor)
-            self.prewitt_edge = dg.prewitt(self.image, 1.5)
+    def change_rendering(self, index: int):
+        self.rendering = self.rendering_box.itemData(index)
+        self.update_drawing()
 
-            self.create_shadow()
-            self.create_prewitt()
-            self.render_drawing()
+    def update_drawing(self):
+        if self.document is not None and self.document.preview_image is not None:
+            self.render()
 
+    def run_algorithm(self):
+        if not self.loading and self.document is not None:
             self.run_button.setEnabled(False)
-            self.shadow_button.setEnabled(True)
-            self.prewitt_button.setEnabled(True)
+            self.render()
+
+            # the other documents not drawn yet follow in the background
+            for document in self.documents:
+                if document is not self.document and document.photo is not None and document.preview_image is None \
+                        and document.job is None:
+                    self.render(document=document)
+
+class Document:
+    # an open image with its own pipeline, the smaller copies drawn first and what was drawn so far
+    def __init__(self, path: str, cache=None, workers: int = None, scratch=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.pipeline = Pipeline(path, cache, workers, scratch)
+        self.image_size = self.pipeline.size
+        self.levels = []
+
+        self.photo = None
+        self.parameters = None
+        self.drawing = None
+        self.preview_image = None
+        self.preview_edge = None
+
+        # the latest job of the document, the only one whose result is taken
+        self.job = None
+        self.worker = None
+
+class WorkerSignals(QObject):
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+
+class Worker(QRunnable):
+    def __init__(self, job: int, function, callback):
+        super(Worker, self).__init__()
+        self.setAutoDelete(False)
+
+        self.job = job
+        self.function = function
+        self.callback = callback
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.function()
+        except Exception as error:
+            self.signals.failed.emit(self.job, str(error))
+        else:
+            self.signals.finished.emit(self.job, result)
 
 class Viewport(QGraphicsView):
+    viewChanged = Signal()
+    filesDropped = Signal(list)
+
     def __init__(self, parent):
         super(Viewport, self).__init__(parent)
         pixmap = QPixmap("Files/Icons/github.png")
@@ -755,7 +1422,13 @@ class Viewport(QGraphicsView):
         self._scene = QGraphicsScene(self)
         self._photo = QGraphicsPixmapItem()
         self._photo.setPixmap(pixmap)
+        self._photo.setTransformationMode(Qt.SmoothTransformation)
         self._scene.addItem(self._photo)
+        self._levels = {}
+        self._level = None
+        self._base = 1
+        self._region = QGraphicsPixmapItem()
+        self._scene.addItem(self._region)
         self.setRenderHint(QPainter.Antialiasing)
 
         self.setScene(self._scene)
@@ -767,11 +1440,14 @@ class Viewport(QGraphicsView):
         self.setFrameShape(QFrame.NoFrame)
         self.setAcceptDrops(True)
 
+        self.horizontalScrollBar().valueChanged.connect(self.viewChanged)
+        self.verticalScrollBar().valueChanged.connect(self.viewChanged)
+
     def hasPhoto(self):
         return not self._empty
 
     def fitInView(self, scale=True):
-        rect = QRectF(self._photo.pixmap().rect())
+        rect = self._photo.sceneBoundingRect()
         if not rect.isNull():
             self.setSceneRect(rect)
             if self.hasPhoto():
@@ -783,20 +1459,92 @@ class Viewport(QGraphicsView):
                              viewrect.height() / scenerect.height())
                 self.scale(factor, factor)
             self._zoom = 0
+            self.showLevel()
 
     def setPhoto(self, pixmap=None):
         self._zoom = 0
+        self._region.setPixmap(QPixmap())
         if pixmap and not pixmap.isNull():
             self._empty = False
             self.setDragMode(QGraphicsView.ScrollHandDrag)
             self._photo.setPixmap(pixmap)
+            self._photo.setScale(1)
             self._size = self.size() 
+            self._width = pixmap.width()
+            self.setLevels(pixmap, 1)
         else:
             self._empty = True
             self.setDragMode(QGraphicsView.NoDrag)
             self._photo.setPixmap(QPixmap())
+            self._photo.setScale(1)
+            self.setLevels(None, 1)
         self.fitInView()
 
+    def setPreview(self, pixmap):
+        # swaps in a lower resolution stand in, stretched over the photo it replaces, without
+        # touching the zoom or the scene rect
+        if self.hasPhoto():
+            self._region.setPixmap(QPixmap())
+            self.setLevels(pixmap, self._width / pixmap.width())
+            self.showLevel()
+
+    def setLevels(self, pixmap, base: float):
+        # the photo at halving resolutions, each one made from the closest finer one the first time a
+        # zoom needs it, base is the size of a pixel of the full level in the scene
+        self._levels = {} if pixmap is None else {0: pixmap}
+        self._level = None
+        self._base = base
+        self._photo.setTransform(QTransform())
+
+    def showLevel(self):
+        # puts up the coarsest level still at least as sharp as the screen, so a repaint or a pan
+        # never resamples more than about the pixels it shows, whatever the size of the photo
+        if not self._levels:
+            return
+
+        full = self._levels[0]
+        density = self.transform().m11() * self._base
+        level = 0
+        while density * 2 ** (level + 1) <= 1 and min(full.width(), full.height()) >> (level + 1) > 0:
+            level += 1
+
+        if level == self._level:
+            return
+
+        if level not in self._levels:
+            finer = max(known for known in self._levels if known < level)
+            self._levels[level] = self._levels[finer].scaled(full.width() >> level, full.height() >> level,
+                                                             Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+        # stretched to the exact extent of the full level, which rounding the halved sides would miss
+        pixmap = self._levels[level]
+        self._level = level
+        self._photo.setPixmap(pixmap)
+        self._photo.setScale(1)
+        self._photo.setTransform(QTransform.fromScale(self._base * full.width() / pixmap.width(),
+                                                      self._base * full.height() / pixmap.height()))
+
+    def setRegion(self, pixmap, rect: QRectF):
+        # lays a full resolution piece over the photo, rect is the part it covers as fractions of the photo
+        if self.hasPhoto():
+            scene = self.sceneRect()
+            self._region.setPixmap(pixmap)
+            self._region.setPos(scene.left() + rect.left() * scene.width(), scene.top() + rect.top() * scene.height())
+            self._region.setScale(rect.width() * scene.width() / pixmap.width())
+
+    def visibleRect(self):
+        # the part of the photo on screen as fractions of it, None when nothing is off screen
+        scene = self.sceneRect()
+        if not self.hasPhoto() or scene.isEmpty():
+            return None
+
+        rect = self.mapToScene(self.viewport().rect()).boundingRect().intersected(scene)
+        if rect.width() >= scene.width() and rect.height() >= scene.height():
+            return None
+
+        return QRectF((rect.left() - scene.left()) / scene.width(), (rect.top() - scene.top()) / scene.height(),
+                      rect.width() / scene.width(), rect.height() / scene.height())
+
     def wheelEvent(self, event):
         if self.hasPhoto():
             if event.angleDelta().y() > 0:
@@ -832,6 +1580,9 @@ class Viewport(QGraphicsView):
             else:
                 self._zoom = -20
 
+        self.showLevel()
+        self.viewChanged.emit()
+
     def toggleDragMode(self):
         if self.dragMode() == QGraphicsView.ScrollHandDrag:
             self.setDragMode(QGraphicsView.NoDrag)
@@ -842,31 +1593,35 @@ class Viewport(QGraphicsView):
         super(Viewport, self).mousePressEvent(event)
 
     def dragEnterEvent(self, event):
-        if event.mimeData().hasImage:
+        if self.droppedFiles(event):
             event.accept()
         else:
             event.ignore()
 
     def dragMoveEvent(self, event):
-        if event.mimeData().hasImage:
+        if self.droppedFiles(event):
             event.setDropAction(Qt.CopyAction)
             event.accept()
         else:
             event.ignore()
 
     def dropEvent(self, event):
-        if event.mimeData().hasImage:
+        paths = self.droppedFiles(event)
+        if paths:
             event.setDropAction(Qt.CopyAction)
             event.accept()
-            # Get the file path of the dropped image
-            file_path = event.mimeData().urls()[0].toLocalFile()
-            self.parent().openFile(file_path)
-            self.setAcceptDrops(False)
+            self.filesDropped.emit(paths)
         else:
             event.ignore()
 
+    def droppedFiles(self, event) -> list:
+        # the local files among the dropped urls, as many as were dropped
+        return [url.toLocalFile() for url in event.mimeData().urls()
+                if url.isLocalFile() and os.path.isfile(url.toLocalFile())]
+
 class SliderInt(QWidget):
     valueChange = Signal(int)
+    released = Signal()
 
     def __init__(self, maximum: int):
         super(SliderInt, self).__init__()
@@ -920,6 +1675,14 @@ class SliderInt(QWidget):
                                     """
                                 )
         self.slider.valueChanged.connect(self.onSliderValueChanged)
+        self.slider.sliderReleased.connect(self.released)
+
+        # values set without dragging, by the keyboard, groove clicks or setValue, are committed
+        # like a release once they settle
+        self.commit_timer = QTimer(self)
+        self.commit_timer.setSingleShot(True)
+        self.commit_timer.setInterval(250)
+        self.commit_timer.timeout.connect(self.released)
 
         layout.addWidget(self.slider)
         layout.addWidget(self.label)
@@ -931,6 +1694,9 @@ class SliderInt(QWidget):
         self.label.setText(str(value))
         self.valueChange.emit(value)
 
+        if not self.slider.isSliderDown():
+            self.commit_timer.start()
+
     def setValue(self, value: int):
         self.label.setText(str(value))
         self.slider.setValue(value)
@@ -940,6 +1706,7 @@ class SliderInt(QWidget):
 
 class SliderFloat(QWidget):
     valueChange = Signal(float)
+    released = Signal()
 
     def __init__(self, maximum: int, factor: float):
         super(SliderFloat, self).__init__()
@@ -994,6 +1761,14 @@ class SliderFloat(QWidget):
                                     """
                                 )
         self.slider.valueChanged.connect(self.onSliderValueChanged)
+        self.slider.sliderReleased.connect(self.released)
+
+        # values set without dragging, by the keyboard, groove clicks or setValue, are committed
+        # like a release once they settle
+        self.commit_timer = QTimer(self)
+        self.commit_timer.setSingleShot(True)
+        self.commit_timer.setInterval(250)
+        self.commit_timer.timeout.connect(self.released)
 
         layout.addWidget(self.slider)
         layout.addWidget(self.label)
@@ -1006,6 +1781,9 @@ class SliderFloat(QWidget):
         self.label.setText(str(value))
         self.valueChange.emit(value)
 
+        if not self.slider.isSliderDown():
+            self.commit_timer.start()
+
     def setValue(self, value: int):
         self.label.setText(str(value / self.factor))
         self.slider.setValue(value)
@@ -0,0 +1,216 @@
+import threading
+
+import numpy as np
+from PIL import Image
+
+import decoding
+import drawing as dg
+from profiling import Span
+
+# the parameters a drawing is made with, the same defaults as the sliders of MainWindow
+defaults = {
+    "scale": 1.5,
+    "operator": "prewitt",
+    "power": 1.5,
+    "shadow_threshold": 72,
+    "edge_threshold": 164,
+    "edge": 2,
+    "engine": None,
+    "tone": 169,
+}
+
+def _grayscale(input: Image.Image) -> np.ndarray:
+    # from here on every stage holds a uint8 array
+    return np.asarray(input.convert("L"))
+
+# name: (function, input stages, parameters, options)
+# a stage is recomputed when one of its parameters or one of its inputs changed, options are
+# handed to the function as keywords but don't change the result
+stages = {
+    "decoded": (decoding.decode, ("source",), ("reduction",), ()),
+    "opaque": (dg.alpha_removal, ("decoded",), (), ()),
+    "resize": (dg.resize, ("opaque",), ("scale",), ("source_size",)),
+    "grayscale": (_grayscale, ("resize",), (), ()),
+    "gradient": (dg.edge_map, ("grayscale",), ("operator", "power"), ("workers",)),
+    "shadow_threshold": (dg.thresholding, ("grayscale",), ("shadow_threshold",), ()),
+    "edge_threshold": (dg.thresholding, ("gradient",), ("edge_threshold",), ()),
+    "shadow": (dg.rasterized, ("shadow_threshold",), ("edge",), ("workers", "engine")),
+    "edges": (dg.rasterized, ("edge_threshold",), ("edge",), ("workers", "engine")),
+    "drawing": (dg.compose, ("shadow", "edges"), ("tone",), ()),
+    "preview_image": (dg.working_copy, ("grayscale",), (), ()),
+    "preview_edge": (dg.working_copy, ("gradient",), (), ()),
+}
+
+# stages only read by the one next to them, released once that one is computed
+transient = {"decoded", "resize"}
+
+# stages that can write their result straight into an array handed to them as out
+direct = {"drawing"}
+
+class Pipeline:
+    # keeps the result of every stage together with the stamp it was made with, evaluating a
+    # stage only recomputes what a parameter change made stale on the way to it
+    def __init__(self, source=None, cache=None, workers: int = None, scratch=None):
+        self.cache = cache
+        self.workers = workers
+        self.scratch = scratch
+
+        self.values = {}
+        self.stamps = {}
+        self.generation = 0
+        self.digest = None
+        self.lock = threading.Lock()
+
+        self.load(source)
+
+    def load(self, source):
+        # source is a path or an image, a path is only decoded at the resolution the scale needs
+        with self.lock:
+            self.source = source
+            self.size = None if source is None else decoding.size(source)
+            self.generation += 1
+            self.values.clear()
+            self.stamps.clear()
+            self.digest = None
+
+    def complete(self, parameters: dict) -> dict:
+        parameters = {**defaults, "workers": self.workers, "source_size": self.size, **parameters}
+        parameters["reduction"] = decoding.reduction(parameters["scale"])
+
+        return parameters
+
+    def evaluate(self, parameters: dict, *names: str) -> dict:
+        parameters = self.complete(parameters)
+
+        with self.lock:
+            return {name: self.value(name, parameters) for name in names}
+
+    def region(self, parameters: dict, box: tuple, halo: int = None) -> Image.Image:
+        # the part of the drawing inside box, computed from a crop with a halo around it, fresh
+        # full resolution stages are cropped and the rest is only computed for the crop
+        parameters = self.complete(parameters)
+
+        if halo is None:
+            halo = 16
+
+        with self.lock:
+            opaque = self.value("opaque", parameters)
+            width, height = (int(side * parameters["scale"]) for side in self.size)
+
+            left, top, right, bottom = box
+            padded = (max(left - halo, 0), max(top - halo, 0), min(right + halo, width), min(bottom + halo, height))
+
+            rows, columns = slice(padded[1], padded[3]), slice(padded[0], padded[2])
+
+            if self.fresh("grayscale", parameters):
+                grayscale = self.values["grayscale"][rows, columns]
+            else:
+                grayscale = _grayscale(dg.resize(opaque, parameters["scale"], padded, self.size))
+
+            if self.fresh("gradient", parameters):
+                gradient = self.values["gradient"][rows, columns]
+            else:
+                gradient = dg.edge_map(grayscale, parameters["operator"], parameters["power"], parameters["workers"])
+
+        edge, workers, engine = parameters["edge"], parameters["workers"], parameters["engine"]
+        shadow = dg.layer(grayscale, parameters["shadow_threshold"], edge, workers, engine)
+        edges = dg.layer(gradient, parameters["edge_threshold"], edge, workers, engine)
+        drawing = dg.compose(shadow, edges, parameters["tone"])
+
+        return drawing[top - padded[1]:bottom - padded[1], left - padded[0]:right - padded[0]]
+
+    def fresh(self, name: str, parameters: dict) -> bool:
+        return self.stamps.get(name) == self.stamp(name, parameters)
+
+    def stale(self, parameters: dict, *names: str) -> set:
+        # the stages an evaluation of names would recompute
+        parameters = self.complete(parameters)
+        result = set()
+
+        def visit(name: str):
+            if name == "source" or name in result:
+                return
+
+            if not self.fresh(name, parameters):
+                result.add(name)
+
+            for input in stages[name][1]:
+                visit(input)
+
+        with self.lock:
+            for name in names:
+                visit(name)
+
+        return result
+
+    def stamp(self, name: str, parameters: dict) -> tuple:
+        if name == "source":
+            return (self.generation,)
+
+        _, inputs, keys, _ = stages[name]
+        return (tuple(parameters[key] for key in keys),
+                tuple(self.stamp(input, parameters) for input in inputs))
+
+    def value(self, name: str, parameters: dict):
+        if name == "source":
+            return self.source
+
+        stamp = self.stamp(name, parameters)
+        if self.stamps.get(name) == stamp:
+            return self.values[name]
+
+        # the cache holds the grayscale plane and the gradient together, a hit skips the resize
+        if name in ("grayscale", "gradient") and self.restore(parameters):
+            return self.values[name]
+
+        function, inputs, keys, options = stages[name]
+        arguments = [self.value(input, parameters) for input in inputs]
+        arguments += [parameters[key] for key in keys]
+
+        keywords = {option: parameters[option] for option in options}
+        if (name in direct and self.scratch is not None and isinstance(arguments[0], np.ndarray)
+                and self.scratch.wants(arguments[0].shape)):
+            keywords["out"] = self.scratch.allocate(arguments[0].shape)
+
+        # named after the stage, the drawing functions inside it show up beneath
+        with Span(name, arguments[0] if arguments else None, "pipeline") as span:
+            span.result = function(*arguments, **keywords)
+
+        self.values[name] = span.result if "out" in keywords else self.keep(span.result)
+        self.stamps[name] = stamp
+
+        for input in inputs:
+            if input in transient:
+                self.values.pop(input, None)
+                self.stamps.pop(input, None)
+
+        if name == "gradient" and self.cache is not None:
+            self.cache.put(self.key(parameters), self.values["grayscale"], self.values["gradient"])
+
+        return self.values[name]
+
+    def keep(self, value):
+        # with a scratch store large arrays live in files the OS can page out
+        return value if self.scratch is None else self.scratch.keep(value)
+
+    def key(self, parameters: dict) -> str:
+        # the digest is taken once per decoded resolution of the loaded image, on the opaque image
+        stamp = self.stamp("opaque", parameters)
+        if self.digest is None or self.digest[0] != stamp:
+            self.digest = (stamp, self.cache.digest(self.value("opaque", parameters)))
+
+        return self.cache.key(self.digest[1], parameters["scale"], parameters["operator"], parameters["power"])
+
+    def restore(self, parameters: dict) -> bool:
+        if self.cache is None:
+            return False
+
+        entry = self.cache.get(self.key(parameters))
+        if entry is None:
+            return False
+
+        for name, value in zip(("grayscale", "gradient"), entry):
+            self.values[name] = self.keep(value)
+            self.stamps[name] = self.stamp(name, parameters)
+
+        return True
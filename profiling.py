@@ -0,0 +1,195 @@
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+# the profiles currently recording, stage calls made from any thread while one is active end up in it
+_profiles = []
+_lock = threading.Lock()
+
+# the calls running on each thread, so a call knows the time its children took
+_local = threading.local()
+
+def pixels(input) -> int:
+    if isinstance(input, np.ndarray):
+        return int(input.shape[0] * input.shape[1]) if input.ndim >= 2 else int(input.size)
+
+    if isinstance(input, Image.Image):
+        return input.size[0] * input.size[1]
+
+    return 0
+
+def allocated(output) -> int:
+    # bytes held by what a stage returned, its buffers that are gone by then aren't counted
+    if isinstance(output, np.ndarray):
+        return int(output.nbytes)
+
+    if isinstance(output, Image.Image):
+        return output.size[0] * output.size[1] * len(output.getbands())
+
+    if isinstance(output, (list, tuple)):
+        return sum(allocated(value) for value in output)
+
+    if isinstance(output, dict):
+        return sum(allocated(value) for value in output.values())
+
+    # pixmaps and other Qt images
+    if hasattr(output, "depth") and hasattr(output, "width"):
+        return output.width() * output.height() * output.depth() // 8
+
+    return 0
+
+class Span:
+    # measures one stage call for every active profile, costs a single check when none is
+    def __init__(self, name: str, input=None, category: str = None):
+        if category is None:
+            category = "drawing"
+
+        self.name = name
+        self.category = category
+        self.input = input
+        self.result = None
+        self.profiles = ()
+
+    def __enter__(self):
+        self.profiles = tuple(_profiles)
+        if not self.profiles:
+            return self
+
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        self.children = 0.0
+        stack.append(self)
+
+        self.cpu = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *error):
+        if not self.profiles:
+            return False
+
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu
+
+        _local.stack.pop()
+        if self.parent is not None:
+            self.parent.children += wall
+
+        thread = threading.current_thread()
+        record = {
+            "name": self.name,
+            "category": self.category,
+            "start": self.start,
+            "wall": wall,
+            "self": wall - self.children,
+            "cpu": cpu,
+            "bytes": allocated(self.result),
+            "pixels": pixels(self.input),
+            "thread": thread.ident,
+            "depth": self.depth,
+        }
+
+        for profile in self.profiles:
+            profile.add(record, thread.name)
+
+        return False
+
+def profiled(function):
+    # records every call of function as a stage named after it, the first argument is its input
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _profiles:
+            return function(*args, **kwargs)
+
+        with Span(function.__name__, args[0] if args else None) as span:
+            span.result = function(*args, **kwargs)
+            return span.result
+
+    return wrapper
+
+class Profile:
+    # collects the stage calls made while it is entered, wall and cpu times are in seconds
+    def __init__(self):
+        self.records = []
+        self.threads = {}
+        self.lock = threading.Lock()
+        self.origin = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.origin = time.perf_counter()
+        with _lock:
+            _profiles.append(self)
+
+        return self
+
+    def __exit__(self, *error):
+        with _lock:
+            _profiles.remove(self)
+
+        self.elapsed = time.perf_counter() - self.origin
+        return False
+
+    def add(self, record: dict, thread: str):
+        with self.lock:
+            self.records.append(record)
+            self.threads.setdefault(record["thread"], thread)
+
+    def summary(self) -> list:
+        # one row per stage, the stages that took the most time on their own first
+        rows = {}
+        with self.lock:
+            records = list(self.records)
+
+        for record in records:
+            row = rows.setdefault((record["category"], record["name"]), {
+                "name": record["name"], "category": record["category"], "calls": 0,
+                "wall": 0.0, "self": 0.0, "cpu": 0.0, "bytes": 0, "pixels": 0,
+            })
+            row["calls"] += 1
+            for key in ("wall", "self", "cpu", "bytes", "pixels"):
+                row[key] += record[key]
+
+        return sorted(rows.values(), key=lambda row: row["self"], reverse=True)
+
+    def trace(self) -> dict:
+        # the Chrome trace event format, opens in chrome://tracing and Perfetto
+        process = os.getpid()
+        with self.lock:
+            records = list(self.records)
+            threads = dict(self.threads)
+
+        events = [{"name": "thread_name", "ph": "M", "pid": process, "tid": thread, "args": {"name": name}}
+                  for thread, name in threads.items()]
+
+        for record in sorted(records, key=lambda record: (record["start"], record["depth"])):
+            events.append({
+                "name": record["name"],
+                "cat": record["category"],
+                "ph": "X",
+                "ts": (record["start"] - self.origin) * 1e6,
+                "dur": record["wall"] * 1e6,
+                "pid": process,
+                "tid": record["thread"],
+                "args": {
+                    "cpu_ms": record["cpu"] * 1000,
+                    "self_ms": record["self"] * 1000,
+                    "bytes": record["bytes"],
+                    "pixels": record["pixels"],
+                },
+            })
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.trace(), file)
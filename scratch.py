@@ -0,0 +1,61 @@
+import glob
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+def sweep(directory: str):
+    # removes the scratch files left in directory, where the system refuses to unlink a mapped
+    # file those still mapped by a running process stay
+    for path in glob.glob(os.path.join(directory, "dijkstra-*.bin")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class Scratch:
+    # file backed arrays in a directory, stage results kept here are paged out by the OS under
+    # memory pressure instead of adding to the resident set, and are read through memmap views
+    def __init__(self, directory: str = None, threshold: int = None):
+        if threshold is None:
+            threshold = 4 * 1024 * 1024
+
+        if directory is None:
+            directory = tempfile.gettempdir()
+
+        os.makedirs(directory, exist_ok=True)
+
+        # files go straight into the directory and are unlinked once mapped, the ones that can't
+        # be, on Windows, are swept when a store is created or collected, at exit and by batch
+        # once its workers are done, as worker processes exit without running finalizers
+        self.directory = directory
+        self.threshold = threshold
+
+        sweep(directory)
+        self.finalizer = weakref.finalize(self, sweep, directory)
+
+    def allocate(self, shape: tuple, dtype=np.uint8) -> np.memmap:
+        handle, path = tempfile.mkstemp(prefix="dijkstra-", suffix=".bin", dir=self.directory)
+        os.close(handle)
+        array = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+
+        # the mapping keeps the unlinked file alive, it is gone with the last view of it
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+        return array
+
+    def wants(self, shape: tuple, dtype=np.uint8) -> bool:
+        return int(np.prod(shape)) * np.dtype(dtype).itemsize >= self.threshold
+
+    def keep(self, value):
+        # moves a large array into a file, anything else is returned as it is
+        if not isinstance(value, np.ndarray) or not self.wants(value.shape, value.dtype):
+            return value
+
+        array = self.allocate(value.shape, value.dtype)
+        array[...] = value
+        return array
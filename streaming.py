@@ -0,0 +1,225 @@
+import math
+import os
+import tempfile
+
+import numpy as np
+from PIL import ExifTags, Image
+
+import drawing as dg
+import decoding
+from pipeline import defaults
+
+# rough peak of bytes held per pixel of a drawing strip while its stages run
+_pixel_bytes = 48
+
+# modes whose bands take one byte each, their rows can be located without decoding
+_byte_modes = {"L", "P", "LA", "PA", "RGB", "RGBA", "RGBX", "CMYK"}
+
+# each value of the EXIF orientation tag undone as flips of the rows and the columns followed by
+# a transposition, the same as the transpositions decoding applies
+_orientations = {
+    2: (False, True, False),
+    3: (True, True, False),
+    4: (True, False, False),
+    5: (False, False, True),
+    6: (True, False, True),
+    7: (True, True, True),
+    8: (False, True, True),
+}
+
+def _open(path: str) -> Image.Image:
+    # the size limit guards against decoding a huge image at once, which is what strips avoid
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        return Image.open(path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+class StripReader:
+    # reads horizontal strips of an image file, without decoding the rows outside of them when
+    # the file stores its rows in independently decodable tiles or as raw rows
+    def __init__(self, path: str):
+        self.path = path
+        self.image = None
+
+        with _open(path) as image:
+            self.size = decoding.stored_size(image)
+            self.mode = image.mode
+            self.tiles = list(image.tile)
+            self.orientation = decoding.orientation(image)
+            self.profile = image.info.get("icc_profile")
+            self.stride = self.raw_stride(image)
+            self.streaming = self.stride is not None or (image.format == "TIFF" and len(self.tiles) > 1)
+
+    def raw_stride(self, image: Image.Image):
+        if len(self.tiles) != 1 or self.tiles[0][0] != "raw":
+            return None
+
+        args = self.tiles[0][3]
+        if isinstance(args, str):
+            args = (args, 0, 1)
+
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+        if orientation not in (1, -1) or self.tiles[0][1] != (0, 0) + self.size:
+            return None
+
+        if not stride:
+            if rawmode != image.mode or image.mode not in _byte_modes:
+                return None
+            stride = self.size[0] * len(image.getbands())
+
+        return stride
+
+    def read(self, top: int, bottom: int) -> Image.Image:
+        width, height = self.size
+
+        if not self.streaming:
+            if self.image is None:
+                self.image = _open(self.path)
+                self.image.load()
+            return self.image.crop((0, top, width, bottom))
+
+        image = _open(self.path)
+        try:
+            if self.stride is not None:
+                name, _, offset, args = self.tiles[0]
+                args = (args, 0, 1) if isinstance(args, str) else tuple(args) + (0, 1)[len(args) - 1:]
+                first = top if args[2] == 1 else height - bottom
+                tiles = [(name, (0, 0, width, bottom - top), offset + first * self.stride,
+                          (args[0], self.stride, args[2]))]
+                base, extent = top, bottom - top
+            else:
+                tiles = [tile for tile in self.tiles if tile[1][1] < bottom and tile[1][3] > top]
+                base = min(tile[1][1] for tile in tiles)
+                extent = max(tile[1][3] for tile in tiles) - base
+                tiles = [(name, (left, upper - base, right, lower - base), offset, args)
+                         for name, (left, upper, right, lower), offset, args in tiles]
+
+            # the decoder only sees the rows of the strip and sizes its buffer to them, strips are
+            # read as stored and turned upright once the drawing is done
+            image._size = (width, extent)
+            if hasattr(image, "_tile_size"):
+                image._tile_size = image._size
+            image.getexif().pop(ExifTags.Base.Orientation, None)
+            image.tile = tiles
+            image.load()
+
+            return image.crop((0, top - base, width, bottom - base))
+        finally:
+            image.close()
+
+    def close(self):
+        if self.image is not None:
+            self.image.close()
+            self.image = None
+
+def streamable(path: str) -> bool:
+    # whether the strips of the image at path can be read without decoding all of it
+    try:
+        return StripReader(path).streaming
+    except (OSError, ValueError):
+        return False
+
+def stream(path: str, output: str, memory: int = None, rows: int = None, halo: int = None, encoding: dict = None,
+           **parameters):
+    # draws the image at path into output one horizontal strip at a time, each strip is computed
+    # from the source rows it depends on plus a halo, so only a few strips are held at once
+    parameters = {**defaults, **{name: value for name, value in parameters.items() if value is not None}}
+
+    if parameters["operator"] in dg.global_operators:
+        raise ValueError(f"{parameters['operator']} looks at the whole image and can't be streamed")
+
+    # alpha and one bit output are converted from a full size copy of the drawing in memory
+    encoding = encoding or {}
+    if encoding.get("transparent") or encoding.get("format") == "group4":
+        raise ValueError("transparent and group4 output are built in memory in full and can't be streamed")
+
+    if halo is None:
+        halo = 16
+
+    reader = StripReader(path)
+    if not reader.streaming:
+        # compressed formats like JPEG and PNG would be decoded whole for the first strip
+        raise ValueError(f"{os.path.basename(path)} isn't stored in strips and can't be streamed, "
+                         "only tiled or uncompressed images can")
+
+    source_width, source_height = reader.size
+    scale = parameters["scale"]
+    width, height = int(source_width * scale), int(source_height * scale)
+
+    if rows is None:
+        if memory is None:
+            memory = 512 * 1024 * 1024
+        rows = max(memory // (width * _pixel_bytes) - 2 * halo, 32)
+
+    # the resampling filter reaches this many source rows past the ones a strip maps to
+    ratio = source_height / height
+    margin = math.ceil(2 * max(ratio, 1)) + 1
+
+    # the drawing is assembled in a file backed buffer the encoder reads straight from
+    temporaries = []
+
+    def buffer(shape: tuple) -> np.memmap:
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)), suffix=".strips")
+        os.close(handle)
+        temporaries.append(temporary)
+        return np.memmap(temporary, dtype=np.uint8, mode="w+", shape=shape)
+
+    # strips are flipped before they are drawn, so the drawing matches that of the upright image,
+    # a transposition is left for the end as it needs all the rows, and as resampling and
+    # rasterizing aren't symmetric those drawings differ slightly from one of the upright image
+    flip_rows, flip_columns, transpose = _orientations.get(reader.orientation, (False, False, False))
+
+    try:
+        canvas = buffer((height, width))
+
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            upper, lower = max(top - halo, 0), min(bottom + halo, height)
+
+            first = max(math.floor(upper * ratio) - margin, 0)
+            last = min(math.ceil(lower * ratio) + margin, source_height)
+
+            # colors are converted strip by strip, like decoding does for the whole image
+            source = reader.read(source_height - last, source_height - first) if flip_rows else reader.read(first, last)
+            if reader.profile:
+                source = decoding.to_srgb(source, reader.profile)
+
+            source = dg.alpha_removal(source)
+            if flip_rows:
+                source = source.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+            if flip_columns:
+                source = source.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+            image = source.resize((width, lower - upper), box=(0, upper * ratio - first, source_width, lower * ratio - first))
+
+            drawing = strip(image, parameters)
+            canvas[top:bottom] = drawing[top - upper:bottom - upper]
+
+        # a strip at a time into a second buffer, the transposition reads the first one by columns
+        if transpose:
+            view = canvas.T
+            upright = buffer(view.shape)
+            for top in range(0, view.shape[0], rows):
+                upright[top:top + rows] = view[top:top + rows]
+            del view, canvas
+            canvas = upright
+
+        canvas.flush()
+        dg.export(canvas, output, pack=False, **encoding)
+        del canvas
+    finally:
+        reader.close()
+        for temporary in temporaries:
+            os.remove(temporary)
+
+def strip(image: Image.Image, parameters: dict) -> np.ndarray:
+    grayscale = np.asarray(image.convert("L"))
+    gradient = dg.gradient(grayscale, parameters["operator"], parameters["power"])
+
+    edge, engine = parameters["edge"], parameters["engine"]
+    shadow = dg.layer(grayscale, parameters["shadow_threshold"], edge, engine=engine)
+    edges = dg.layer(gradient, parameters["edge_threshold"], edge, engine=engine)
+
+    return dg.compose(shadow, edges, parameters["tone"])
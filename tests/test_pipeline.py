@@ -0,0 +1,42 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import decoding
+import drawing as dg
+from pipeline import Pipeline
+
+def photo(size: tuple, seed: int = 0) -> Image.Image:
+    width, height = size
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+def test_drawing_of_in_memory_image():
+    image = photo((120, 90))
+    drawing = Pipeline(image).evaluate({}, "drawing")["drawing"]
+
+    assert drawing.shape == (135, 180)
+    assert drawing.dtype == np.uint8
+
+@pytest.mark.parametrize("rotation", [1, 3, 6, 8])
+@pytest.mark.parametrize("extension", [".jpg", ".png"])
+def test_orientation_is_applied_once(tmp_path, rotation, extension):
+    exif = Image.Exif()
+    exif[0x0112] = rotation
+    path = str(tmp_path / f"photo{extension}")
+    photo((160, 120)).save(path, exif=exif)
+
+    upright = (120, 160) if rotation in (6, 8) else (160, 120)
+    image = decoding.decode(path)
+
+    # decoded photos are handed on to the pipeline and resized, neither may turn them again
+    assert image.size == upright
+    assert decoding.decode(image).size == upright
+    assert decoding.size(dg.working_copy(dg.alpha_removal(image), 80)) == tuple(side // 2 for side in upright)
+
+    drawing = Pipeline(image).evaluate({}, "drawing")["drawing"]
+    assert drawing.shape == (int(upright[1] * 1.5), int(upright[0] * 1.5))
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import drawing as dg
+
+def reference_prewitt(input: Image.Image, power: float = None) -> Image.Image:
+    # the original per pixel operator, the vectorized one has to match it bit for bit
+    input = input.convert('L')
+    image = np.array(input).astype(np.uint8)
+
+    if power is None:
+        power = 1.0
+
+    h, w = image.shape
+    horizontal = np.array([[-1, 0, 1], [-1, 0, 1], [-1, 0, 1]])
+    vertical = np.array([[-1, -1, -1], [0, 0, 0], [1, 1, 1]])
+
+    newgradientImage = np.zeros((h, w))
+
+    for i in range(1, h - 1):
+        for j in range(1, w - 1):
+            horizontalGrad = (horizontal[0, 0] * image[i - 1, j - 1]) + \
+                            (horizontal[0, 1] * image[i - 1, j]) + \
+                            (horizontal[0, 2] * image[i - 1, j + 1]) + \
+                            (horizontal[1, 0] * image[i, j - 1]) + \
+                            (horizontal[1, 1] * image[i, j]) + \
+                            (horizontal[1, 2] * image[i, j + 1]) + \
+                            (horizontal[2, 0] * image[i + 1, j - 1]) + \
+                            (horizontal[2, 1] * image[i + 1, j]) + \
+                            (horizontal[2, 2] * image[i + 1, j + 1])
+
+            verticalGrad = (vertical[0, 0] * image[i - 1, j - 1]) + \
+                        (vertical[0, 1] * image[i - 1, j]) + \
+                        (vertical[0, 2] * image[i - 1, j + 1]) + \
+                        (vertical[1, 0] * image[i, j - 1]) + \
+                        (vertical[1, 1] * image[i, j]) + \
+                        (vertical[1, 2] * image[i, j + 1]) + \
+                        (vertical[2, 0] * image[i + 1, j - 1]) + \
+                        (vertical[2, 1] * image[i + 1, j]) + \
+                        (vertical[2, 2] * image[i + 1, j + 1])
+
+            mag = np.sqrt(pow(horizontalGrad, 2.0) + pow(verticalGrad, 2.0)) * power
+            newgradientImage[i - 1, j - 1] = mag
+
+    image = Image.fromarray(newgradientImage)
+    image = image.convert("L")
+    image = ImageOps.invert(image)
+
+    return image
+
+def photo(size: tuple, mode: str, seed: int = 0) -> Image.Image:
+    # noise over a gradient and a hard edge, so both weak and saturated gradients occur
+    width, height = size
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width)
+    y = np.linspace(0, 255, height)[:, None]
+    base = (x * 0.5 + y * 0.5)[..., None] + rng.normal(0, 24, (height, width, 3))
+    base[:, width // 2:] = 255 - base[:, width // 2:]
+    image = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8))
+
+    return image.convert(mode)
+
+def assert_same(result: Image.Image, expected: Image.Image):
+    assert result.mode == expected.mode
+    assert result.size == expected.size
+    assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+@pytest.mark.parametrize("mode", ["L", "RGB"])
+@pytest.mark.parametrize("power", [None, 0.25, 1.0, 1.7, 3.0, 8.0])
+def test_matches_reference(mode, power):
+    image = photo((61, 47), mode)
+    assert_same(dg.prewitt(image, power), reference_prewitt(image, power))
+
+@pytest.mark.parametrize("mode", ["L", "RGB"])
+def test_matches_reference_across_row_blocks(mode):
+    # taller than one 256 row block of the vectorized version
+    image = photo((9, 530), mode, seed=1)
+    assert_same(dg.prewitt(image, 2.0), reference_prewitt(image, 2.0))
+
+@pytest.mark.parametrize("mode", ["L", "RGB"])
+@pytest.mark.parametrize("size", [(1, 1), (2, 2), (1, 9), (9, 2), (3, 3), (3, 7), (8, 3)])
+def test_small_sizes(mode, size):
+    image = photo(size, mode, seed=2)
+    assert_same(dg.prewitt(image), reference_prewitt(image))
+
+def test_flat_image():
+    image = Image.new("L", (16, 12), 128)
+    assert_same(dg.prewitt(image, 5.0), reference_prewitt(image, 5.0))